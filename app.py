@@ -11,6 +11,9 @@ import streamlit as st
 import streamlit.components.v1 as components
 
 from auth import ensure_auth, login_ui, logout
+from db import finish_query_log, start_query_log
+from price_history import get_market_data
+from upstream import UpstreamError, upstream
 
 
 st.set_page_config(
@@ -19,6 +22,8 @@ st.set_page_config(
     layout="wide",
 )
 
+start_query_log()
+
 
 # -----------------------------------------
 # GLOBAL STYLING
@@ -230,13 +235,28 @@ MARKETAUX_API_TOKEN = get_secret("MARKETAUX_API_TOKEN", "")
 MARKETAUX_NEWS_URL = "https://api.marketaux.com/v1/news/all"
 
 
-@st.cache_data(ttl=1800, show_spinner=False)
+MARKETAUX_REFRESH_SECONDS = 1800
+MARKETAUX_TIMEOUT_SECONDS = 12
+
+# How long the first render of a cold process waits for the first
+# news fetch before showing NEWS_UNAVAILABLE.
+NEWS_COLD_START_WAIT_SECONDS = 5.0
+
+NEWS_UNAVAILABLE = {
+    "ok": False,
+    "articles": [],
+    "message": "Live market news is temporarily unavailable.",
+}
+
+
 def fetch_marketaux_news():
     """
-    Fetch a quota-conscious, cached snapshot of the latest English-language
+    Fetch a quota-conscious snapshot of the latest English-language
     financial-market news. The free Marketaux plan currently returns up to
-    three articles per request, so one cached request supplies both the
+    three articles per request, so one shared snapshot supplies both the
     homepage and Markets & Economy page.
+
+    Returns None on a transient failure so the last good snapshot is kept.
     """
     if not MARKETAUX_API_TOKEN:
         return {
@@ -253,19 +273,13 @@ def fetch_marketaux_news():
     }
 
     try:
-        response = requests.get(
+        response = upstream.get(
+            "marketaux",
             MARKETAUX_NEWS_URL,
             params=params,
-            timeout=12,
+            timeout=MARKETAUX_TIMEOUT_SECONDS,
         )
 
-        if response.status_code != 200:
-            return {
-                "ok": False,
-                "articles": [],
-                "message": "Live market news is temporarily unavailable.",
-            }
-
         payload = response.json()
         articles = payload.get("data", [])
 
@@ -278,12 +292,28 @@ def fetch_marketaux_news():
             "message": "",
         }
 
-    except (requests.RequestException, ValueError):
-        return {
-            "ok": False,
-            "articles": [],
-            "message": "Live market news is temporarily unavailable.",
-        }
+    except (requests.RequestException, UpstreamError, ValueError):
+        return None
+
+
+def get_market_news():
+    """
+    Read the news snapshot refreshed in the background together with
+    market prices, so no page render waits on Marketaux.
+    """
+    service = get_market_data()
+    service.register_feed(
+        "news",
+        fetch_marketaux_news,
+        interval=MARKETAUX_REFRESH_SECONDS,
+        timeout=MARKETAUX_TIMEOUT_SECONDS + 3,
+    )
+
+    if "news" not in service.snapshot().feeds:
+        # Cold process: give the first fetch a moment (bounded).
+        service.wait_for_first_fetch("news", NEWS_COLD_START_WAIT_SECONDS)
+
+    return service.snapshot().feeds.get("news") or NEWS_UNAVAILABLE
 
 
 def format_news_time(value):
@@ -305,11 +335,11 @@ def format_news_time(value):
 
 def render_live_market_news(compact=False):
     """
-    Render the cached Marketaux news snapshot.
+    Render the shared Marketaux news snapshot.
     `compact=True` is used on the homepage; the full version is shown
     on Markets & Economy.
     """
-    result = fetch_marketaux_news()
+    result = get_market_news()
     articles = result.get("articles", [])
 
     if not result.get("ok") or not articles:
@@ -2058,3 +2088,5 @@ elif selected_page == "Dashboard":
 
 else:
     render_home_page(user_is_authenticated)
+
+finish_query_log()
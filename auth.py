@@ -1,6 +1,101 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 
-from db import get_supabase
+from db import get_secret, get_supabase
+
+
+# Refresh the access token this many seconds before it expires.
+TOKEN_REFRESH_MARGIN = 120
+
+# Project JWT secret (Settings -> API). When set, HS256 access tokens
+# are verified locally; otherwise each new token is checked once online.
+SUPABASE_JWT_SECRET = get_secret("SUPABASE_JWT_SECRET")
+
+# How often a verified session is re-checked against Supabase Auth
+# in the background (catches revoked sessions / deleted users).
+AUTH_REVALIDATE_SECONDS = 600
+
+_revalidator = ThreadPoolExecutor(
+    max_workers=4,
+    thread_name_prefix="auth-revalidate",
+)
+
+
+# -----------------------------------------
+# JWT HELPERS
+# -----------------------------------------
+def decode_jwt_payload(token):
+    """
+    Decode a JWT payload without verifying it. Only used to read
+    claims such as `exp`; never to trust the token.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except Exception:
+        return {}
+
+
+def _b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def verify_jwt_locally(token, secret=None):
+    """
+    Return the token's claims if its HS256 signature and expiry check
+    out locally, otherwise None. Tokens signed with other algorithms
+    (or without a configured secret) cannot be verified here.
+    """
+    secret = SUPABASE_JWT_SECRET if secret is None else secret
+
+    if not secret or not token:
+        return None
+
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64url_decode(header_b64))
+
+        if header.get("alg") != "HS256":
+            return None
+
+        expected = hmac.new(
+            secret.encode(),
+            f"{header_b64}.{payload_b64}".encode(),
+            hashlib.sha256,
+        ).digest()
+
+        if not hmac.compare_digest(expected, _b64url_decode(signature_b64)):
+            return None
+
+        claims = json.loads(_b64url_decode(payload_b64))
+
+    except Exception:
+        return None
+
+    if int(claims.get("exp") or 0) <= time.time():
+        return None
+
+    return claims
+
+
+def token_expiry(token):
+    try:
+        return int(decode_jwt_payload(token).get("exp"))
+    except (TypeError, ValueError):
+        return None
+
+
+def store_session(session):
+    st.session_state.access_token = session.access_token
+    st.session_state.refresh_token = session.refresh_token
+    st.session_state.bound_access_token = session.access_token
 
 
 # -----------------------------------------
@@ -8,20 +103,48 @@ from db import get_supabase
 # -----------------------------------------
 def get_auth_client():
     """
-    Return the session-isolated Supabase client and attach
-    the stored authentication session.
+    Return the session-isolated Supabase client with the stored
+    authentication session attached.
+
+    The session is attached once per access token; later calls only
+    check the token's expiry locally and refresh it shortly before it
+    runs out, so ordinary queries make no extra auth round trips.
     """
     supabase = get_supabase()
 
     access_token = st.session_state.get("access_token")
     refresh_token = st.session_state.get("refresh_token")
 
-    if access_token and refresh_token:
+    if not access_token or not refresh_token:
+        return supabase
+
+    if st.session_state.get("bound_access_token") != access_token:
         try:
-            supabase.auth.set_session(
+            response = supabase.auth.set_session(
                 access_token=access_token,
                 refresh_token=refresh_token,
             )
+        except Exception:
+            return supabase
+
+        # set_session refreshes an already-expired token itself.
+        if response and response.session:
+            store_session(response.session)
+            access_token = response.session.access_token
+        else:
+            st.session_state.bound_access_token = access_token
+
+    expires_at = token_expiry(access_token)
+
+    if expires_at and expires_at - time.time() <= TOKEN_REFRESH_MARGIN:
+        try:
+            # No argument: use the client's own (possibly auto-rotated)
+            # refresh token rather than a stale copy.
+            response = supabase.auth.refresh_session()
+
+            if response and response.session:
+                store_session(response.session)
+
         except Exception:
             pass
 
@@ -31,28 +154,118 @@ def get_auth_client():
 # -----------------------------------------
 # ENSURE AUTH
 # -----------------------------------------
+def _fetch_user(supabase, access_token):
+    response = supabase.auth.get_user(access_token)
+    return response.user if response else None
+
+
+def _clear_auth_state():
+    for key in [
+        "access_token",
+        "refresh_token",
+        "bound_access_token",
+        "auth_verified_token",
+        "auth_revalidation",
+    ]:
+        st.session_state.pop(key, None)
+
+
+def _background_revalidation(supabase, access_token):
+    """
+    Start (or collect) the periodic online check of the session.
+    Returns False only when Supabase Auth has rejected the token.
+    """
+    pending = st.session_state.get("auth_revalidation")
+
+    if pending is not None:
+        if not pending.done():
+            return True
+
+        st.session_state.pop("auth_revalidation", None)
+
+        try:
+            user = pending.result()
+        except Exception as error:
+            # Network trouble is not a revocation; retry next interval.
+            if getattr(error, "status", None) in (401, 403):
+                return False
+            user = True
+
+        if not user:
+            return False
+
+        if user is not True:
+            st.session_state.user = user
+
+        st.session_state.auth_checked_at = time.time()
+        return True
+
+    checked_at = st.session_state.get("auth_checked_at", 0.0)
+
+    if time.time() - checked_at >= AUTH_REVALIDATE_SECONDS:
+        st.session_state.auth_revalidation = _revalidator.submit(
+            _fetch_user,
+            supabase,
+            access_token,
+        )
+
+    return True
+
+
 def ensure_auth() -> bool:
     """
     Confirm that the current Streamlit session contains
     a valid authenticated Supabase user.
+
+    A token is verified once (locally via its signature when the JWT
+    secret is configured, otherwise with one get_user call). After that
+    each rerun only checks expiry locally, while a background check
+    re-validates the session every AUTH_REVALIDATE_SECONDS.
     """
     if "access_token" not in st.session_state:
         return False
 
     supabase = get_auth_client()
+    access_token = st.session_state.get("access_token")
+    expires_at = token_expiry(access_token)
 
-    try:
-        response = supabase.auth.get_user()
+    if not access_token or (expires_at and expires_at <= time.time()):
+        return False
 
-        if response and response.user:
-            st.session_state.user = response.user
-            st.session_state.user_id = response.user.id
-            return True
+    if (
+        st.session_state.get("auth_verified_token") != access_token
+        or "user_id" not in st.session_state
+    ):
+        claims = verify_jwt_locally(access_token)
 
-    except Exception:
-        pass
+        if (
+            claims
+            and "user" in st.session_state
+            and claims.get("sub") == str(st.session_state.get("user_id"))
+        ):
+            st.session_state.auth_verified_token = access_token
 
-    return False
+        else:
+            try:
+                user = _fetch_user(supabase, access_token)
+            except Exception:
+                return False
+
+            if not user:
+                return False
+
+            st.session_state.user = user
+            st.session_state.user_id = user.id
+            st.session_state.auth_verified_token = access_token
+            st.session_state.auth_checked_at = time.time()
+
+        return True
+
+    if not _background_revalidation(supabase, access_token):
+        _clear_auth_state()
+        return False
+
+    return True
 
 
 # -----------------------------------------
@@ -138,12 +351,7 @@ def login_ui():
                 )
 
                 if response.user and response.session:
-                    st.session_state.access_token = (
-                        response.session.access_token
-                    )
-                    st.session_state.refresh_token = (
-                        response.session.refresh_token
-                    )
+                    store_session(response.session)
                     st.session_state.user = response.user
                     st.session_state.user_id = response.user.id
                     st.session_state.profile_panel_open = False
@@ -216,12 +424,7 @@ def login_ui():
 
                 if response.user:
                     if response.session:
-                        st.session_state.access_token = (
-                            response.session.access_token
-                        )
-                        st.session_state.refresh_token = (
-                            response.session.refresh_token
-                        )
+                        store_session(response.session)
                         st.session_state.user = response.user
                         st.session_state.user_id = response.user.id
                         st.session_state.profile_panel_open = False
@@ -0,0 +1,241 @@
+# bench_pages.py
+"""
+Smoke test / benchmark for the portfolio pages.
+
+Runs every mode page (crypto, stock, ETF, bond, overview) headlessly
+with Streamlit's AppTest against the in-memory Supabase stand-in
+(fake_supabase.py) and replayed prices, so no network or credentials
+are needed. For each page it reports the database queries and render
+time of a cold run and a warm rerun, and exits non-zero if a page
+raised, showed an error or made more queries than allowed.
+
+    python bench_pages.py
+    python bench_pages.py --latency-ms 40 --reruns 3 --max-queries 25
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+REPO_DIR = str(Path(__file__).resolve().parent)
+
+PAGES = {
+    "crypto": ("crypto_mode", "crypto_app"),
+    "stock": ("stock_mode", "stock_app"),
+    "etf": ("etf_mode", "etf_app"),
+    "bond": ("bond_mode", "bond_app"),
+    "overview": ("overview_mode", "overview_app"),
+}
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "bench-password"
+
+REPLAY_PRICES = {
+    "crypto": [{"BTC": 65000.0, "ETH": 3200.0, "SOL": 150.0}],
+    "stocks": [{"AAPL": 210.0, "MSFT": 420.0, "SPY": 540.0, "QQQ": 470.0}],
+}
+
+
+# -----------------------------------------
+# PAGE SCRIPT (RUN BY APPTEST)
+# -----------------------------------------
+def render_page(repo_dir, module_name, app_name, email, password):
+    import importlib
+    import sys
+
+    import streamlit as st
+
+    if repo_dir not in sys.path:
+        sys.path.insert(0, repo_dir)
+
+    from auth import store_session
+    from db import get_supabase, start_query_log
+
+    if "user_id" not in st.session_state:
+        response = get_supabase().auth.sign_in_with_password(
+            {"email": email, "password": password}
+        )
+        store_session(response.session)
+        st.session_state.user = response.user
+        st.session_state.user_id = response.user.id
+
+    start_query_log()
+    getattr(importlib.import_module(module_name), app_name)()
+
+
+# -----------------------------------------
+# SEED DATA
+# -----------------------------------------
+def seed(backend):
+    from fake_supabase import FakeSupabase
+
+    user_id = FakeSupabase(backend).auth.sign_up(
+        {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+    ).user.id
+
+    backend.seed("crypto_holdings", [
+        {"user_id": user_id, "symbol": "BTC", "quantity": 0.5},
+        {"user_id": user_id, "symbol": "ETH", "quantity": 4.0},
+        {"user_id": user_id, "symbol": "SOL", "quantity": 20.0},
+    ])
+    backend.seed("stock_holdings", [
+        {"user_id": user_id, "symbol": "AAPL", "quantity": 10.0},
+        {"user_id": user_id, "symbol": "MSFT", "quantity": 5.0},
+    ])
+    backend.seed("etf_holdings", [
+        {"user_id": user_id, "symbol": "SPY", "quantity": 3.0},
+        {"user_id": user_id, "symbol": "QQQ", "quantity": 2.0},
+    ])
+    backend.seed("bond_holdings", [{
+        "id": "bench-bond-1",
+        "user_id": user_id,
+        "name": "Treasury 2030",
+        "issuer": "Government",
+        "currency_code": "GHS",
+        "face_value": 10000.0,
+        "purchase_value": 9500.0,
+        "current_value": 9800.0,
+        "coupon_rate": 12.5,
+        "income_received": 600.0,
+        "usd_to_native_rate": 14.5,
+        "maturity_date": "2030-06-30",
+        "payment_frequency": "Semi-annual",
+    }])
+    backend.seed("user_settings", [
+        {"user_id": user_id, "key": key, "value": value}
+        for key, value in {
+            "crypto_rate": 14.5,
+            "crypto_investment": 250000.0,
+            "stock_rate": 14.5,
+            "stock_investment": 40000.0,
+            "etf_rate": 14.5,
+            "etf_investment": 20000.0,
+        }.items()
+    ])
+
+    start = datetime.utcnow() - timedelta(days=120)
+    backend.seed("portfolio_history", [
+        {
+            "user_id": user_id,
+            "mode": mode,
+            "timestamp": (start + timedelta(hours=6 * i)).isoformat(),
+            "value_ghs": 100000.0 + 150.0 * i,
+        }
+        for mode in PAGES
+        for i in range(480)
+    ])
+
+
+def warm_prices():
+    """
+    Publish one replayed price snapshot before the first page renders,
+    as a running server would have.
+    """
+    from price_history import get_market_data
+
+    service = get_market_data()
+    service.watch("crypto", list(REPLAY_PRICES["crypto"][0]))
+    service.watch("stocks", list(REPLAY_PRICES["stocks"][0]))
+    service.refresh(force=True)
+
+
+# -----------------------------------------
+# RUNNER
+# -----------------------------------------
+def run_page(name, reruns, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    from fake_supabase import backend
+
+    module_name, app_name = PAGES[name]
+    app = AppTest.from_function(
+        render_page,
+        args=(REPO_DIR, module_name, app_name, BENCH_EMAIL, BENCH_PASSWORD),
+        default_timeout=timeout,
+    )
+
+    results = []
+
+    for run in range(reruns + 1):
+        backend.reset_stats()
+        started = time.perf_counter()
+        app.run()
+        elapsed = time.perf_counter() - started
+
+        calls = list(backend.calls)
+        results.append({
+            "page": name,
+            "run": "cold" if run == 0 else f"warm {run}",
+            "queries": len(calls),
+            "db_ms": sum(call[3] for call in calls) * 1000,
+            "render_ms": elapsed * 1000,
+            "errors": [str(e.value) for e in app.exception]
+            + [str(e.value) for e in app.error],
+        })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render every mode page against the in-memory backend.",
+    )
+    parser.add_argument("--reruns", type=int, default=1,
+                        help="warm reruns per page after the cold run")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="delay added to every fake database query")
+    parser.add_argument("--max-queries", type=int, default=30,
+                        help="fail if a single run makes more queries")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds allowed per page run")
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES),
+                        default=list(PAGES))
+    args = parser.parse_args()
+
+    replay_file = Path(tempfile.mkdtemp()) / "price_replay.json"
+    replay_file.write_text(json.dumps(REPLAY_PRICES))
+
+    # Must be set before any repo module reads its secrets.
+    os.environ.update({
+        "SUPABASE_BACKEND": "memory",
+        "SUPABASE_FAKE_LATENCY_MS": str(args.latency_ms),
+        "PRICE_PROVIDER": "replay",
+        "PRICE_REPLAY_FILE": str(replay_file),
+    })
+    sys.path.insert(0, REPO_DIR)
+
+    from fake_supabase import backend
+
+    seed(backend)
+    warm_prices()
+
+    failed = False
+
+    print(f"{'page':<10}{'run':<9}{'queries':>8}{'db ms':>10}{'render ms':>12}")
+
+    for name in args.pages:
+        for result in run_page(name, args.reruns, args.timeout):
+            print(
+                f"{result['page']:<10}{result['run']:<9}"
+                f"{result['queries']:>8}{result['db_ms']:>10.0f}"
+                f"{result['render_ms']:>12.0f}"
+            )
+
+            for error in result["errors"]:
+                print("   ERROR:", error)
+                failed = True
+
+            if result["queries"] > args.max_queries:
+                print(f"   TOO MANY QUERIES (> {args.max_queries})")
+                failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
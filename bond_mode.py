@@ -1,12 +1,14 @@
 import uuid
-from datetime import date, datetime
+from datetime import date
 
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 
-from db import get_supabase
-from portfolio_tracker import autosave_portfolio_value
+from auth import get_auth_client
+from history_store import load_chart_history
+from settings_store import load_setting, save_setting
+from portfolio_tracker import autosave_portfolio_value, manual_snapshot
 
 
 CURRENCY_OPTIONS = [
@@ -67,41 +69,7 @@ DONUT_CHART_CONFIG = {
 
 
 def db():
-    supabase = get_supabase()
-
-    if "access_token" in st.session_state:
-        try:
-            supabase.auth.set_session(
-                access_token=st.session_state.access_token,
-                refresh_token=st.session_state.refresh_token,
-            )
-        except Exception:
-            pass
-
-    return supabase
-
-
-def load_setting(user_id, key, default):
-    try:
-        res = (
-            db()
-            .table("user_settings")
-            .select("value")
-            .eq("user_id", user_id)
-            .eq("key", key)
-            .single()
-            .execute()
-        )
-        return float(res.data["value"])
-    except Exception:
-        return default
-
-
-def save_setting(user_id, key, value):
-    db().table("user_settings").upsert(
-        {"user_id": user_id, "key": key, "value": float(value)},
-        on_conflict="user_id,key",
-    ).execute()
+    return get_auth_client()
 
 
 def currency_label(currency):
@@ -125,21 +93,29 @@ def metric_delta(value):
     return "0.00%"
 
 
+def fetch_bond_holdings(client, user_id):
+    """
+    Raises on failure and touches no session state, so the overview
+    can run it off the script thread.
+    """
+    res = (
+        client
+        .table("bond_holdings")
+        .select(
+            "id,name,issuer,bond_type,currency_code,usd_to_native_rate,"
+            "face_value,purchase_value,current_value,coupon_rate,"
+            "income_received,maturity_date,payment_frequency"
+        )
+        .eq("user_id", user_id)
+        .order("created_at")
+        .execute()
+    )
+    return res.data or []
+
+
 def load_bond_holdings(user_id):
     try:
-        res = (
-            db()
-            .table("bond_holdings")
-            .select(
-                "id,name,issuer,bond_type,currency_code,usd_to_native_rate,"
-                "face_value,purchase_value,current_value,coupon_rate,"
-                "income_received,maturity_date,payment_frequency"
-            )
-            .eq("user_id", user_id)
-            .order("created_at")
-            .execute()
-        )
-        return res.data or []
+        return fetch_bond_holdings(db(), user_id)
     except Exception as error:
         print("Load bond holdings failed:", error)
         return []
@@ -176,51 +152,8 @@ def delete_bond_holding(user_id, holding_id):
     )
 
 
-def load_portfolio_history(user_id):
-    try:
-        res = (
-            db()
-            .table("portfolio_history")
-            .select("timestamp,value_ghs")
-            .eq("user_id", user_id)
-            .eq("mode", "bond")
-            .order("timestamp")
-            .execute()
-        )
-        return res.data or []
-    except Exception:
-        return []
-
-
 def force_snapshot(user_id, value, mode="bond"):
-    try:
-        db().table("portfolio_history").insert(
-            {
-                "user_id": user_id,
-                "timestamp": datetime.utcnow().isoformat(),
-                "value_ghs": round(float(value), 2),
-                "mode": mode,
-            }
-        ).execute()
-        return True
-    except Exception as error:
-        print("Bond snapshot failed:", error)
-        return False
-
-
-def clean_history(history):
-    if not history:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(history)
-
-    if df.empty:
-        return df
-
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    df["value_ghs"] = pd.to_numeric(df["value_ghs"], errors="coerce")
-    df = df.dropna().sort_values("timestamp")
-    return df
+    return manual_snapshot(user_id, value, mode)
 
 
 def build_pnl(history_df, invested):
@@ -884,7 +817,7 @@ def bond_app():
             hide_index=True,
         )
 
-    history = clean_history(load_portfolio_history(user_id))
+    history = load_chart_history(user_id, "bond")
 
     st.subheader("Portfolio Trend")
 
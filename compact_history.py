@@ -0,0 +1,121 @@
+# compact_history.py
+"""
+Retention / compaction job for portfolio_history.
+
+    python compact_history.py                 # one run
+    python compact_history.py --dry-run       # report only
+    python compact_history.py --every 86400   # keep running daily
+
+Needs SUPABASE_SERVICE_ROLE_KEY and migrations/003.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from db import get_service_client
+
+
+# -----------------------------------------
+# RETENTION POLICY
+# full resolution for RAW_RETENTION_DAYS,
+# hourly up to HOURLY_RETENTION_DAYS,
+# daily after that.
+# -----------------------------------------
+RAW_RETENTION_DAYS = 7
+HOURLY_RETENTION_DAYS = 90
+
+
+def compact_history(
+    raw_days=RAW_RETENTION_DAYS,
+    hourly_days=HOURLY_RETENTION_DAYS,
+    dry_run=False,
+):
+    """
+    Returns (rows_removed, bytes_reclaimed).
+    """
+    client = get_service_client()
+
+    if client is None:
+        raise RuntimeError(
+            "SUPABASE_SERVICE_ROLE_KEY is required to compact history."
+        )
+
+    now = datetime.utcnow()
+
+    res = client.rpc(
+        "compact_portfolio_history",
+        {
+            "raw_before": (now - timedelta(days=raw_days)).isoformat(),
+            "hourly_before": (now - timedelta(days=hourly_days)).isoformat(),
+            "dry_run": dry_run,
+        },
+    ).execute()
+
+    row = (res.data or [{}])[0]
+
+    return (
+        int(row.get("rows_removed") or 0),
+        int(row.get("bytes_reclaimed") or 0),
+    )
+
+
+def format_bytes(size):
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:,.0f} {unit}"
+        size /= 1024
+
+    return f"{size:,.1f} GB"
+
+
+def run_once(args):
+    started = time.time()
+
+    try:
+        rows, size = compact_history(
+            raw_days=args.raw_days,
+            hourly_days=args.hourly_days,
+            dry_run=args.dry_run,
+        )
+    except Exception as error:
+        print("History compaction failed:", error)
+        return False
+
+    verb = "Would remove" if args.dry_run else "Removed"
+
+    print(
+        f"{verb} {rows:,} portfolio_history rows "
+        f"({format_bytes(size)}) in {time.time() - started:.1f}s"
+    )
+
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Thin old portfolio_history rows to hourly/daily points."
+    )
+    parser.add_argument("--raw-days", type=int, default=RAW_RETENTION_DAYS)
+    parser.add_argument("--hourly-days", type=int, default=HOURLY_RETENTION_DAYS)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--every",
+        type=int,
+        default=0,
+        help="Repeat every N seconds instead of running once.",
+    )
+    args = parser.parse_args()
+
+    if args.raw_days < 1 or args.hourly_days < args.raw_days:
+        parser.error("need 1 <= --raw-days <= --hourly-days")
+
+    if not args.every:
+        raise SystemExit(0 if run_once(args) else 1)
+
+    while True:
+        run_once(args)
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,11 @@ import pandas as pd
 from datetime import datetime
 import plotly.graph_objects as go
 
-from price_history import crypto_live_prices
-from portfolio_tracker import autosave_portfolio_value
-from db import get_supabase
+from price_history import crypto_live_prices, held_symbols
+from portfolio_tracker import autosave_portfolio_value, manual_snapshot
+from history_store import load_chart_history, load_history
+from holdings_store import load_holdings, save_holdings
+from settings_store import load_setting, save_setting
 
 
 API_MAP = {
@@ -70,33 +72,8 @@ DONUT_CHART_CONFIG = {
 }
 
 
-def db():
-    supabase = get_supabase()
-
-    if "access_token" in st.session_state:
-        try:
-            supabase.auth.set_session(
-                access_token=st.session_state.access_token,
-                refresh_token=st.session_state.refresh_token,
-            )
-        except Exception:
-            pass
-
-    return supabase
-
-
 def force_snapshot(user_id, value_ghs, mode="crypto"):
-    try:
-        db().table("portfolio_history").insert({
-            "user_id": user_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "value_ghs": round(float(value_ghs), 2),
-            "mode": mode,
-        }).execute()
-        return True
-    except Exception as e:
-        print("Force snapshot failed:", e)
-        return False
+    return manual_snapshot(user_id, value_ghs, mode)
 
 
 def safe_price(symbol, price):
@@ -123,29 +100,6 @@ def set_last_good_value(value):
     st.session_state.crypto_last_good_value = value
 
 
-def load_setting(user_id, key, default):
-    try:
-        res = (
-            db()
-            .table("user_settings")
-            .select("value")
-            .eq("user_id", user_id)
-            .eq("key", key)
-            .single()
-            .execute()
-        )
-        return float(res.data["value"])
-    except Exception:
-        return default
-
-
-def save_setting(user_id, key, value):
-    db().table("user_settings").upsert(
-        {"user_id": user_id, "key": key, "value": float(value)},
-        on_conflict="user_id,key",
-    ).execute()
-
-
 def currency_label(currency):
     return f'{currency["code"]} - {currency["name"]}'
 
@@ -160,72 +114,25 @@ def fmt(v, currency):
 
 
 def build_pnl_history(history, invested):
-    if not history:
+    if history.empty:
         return pd.DataFrame()
 
-    h = pd.DataFrame(history)
-
-    if h.empty:
-        return pd.DataFrame()
-
-    h["timestamp"] = pd.to_datetime(h["timestamp"], errors="coerce")
-    h["value_ghs"] = pd.to_numeric(h["value_ghs"], errors="coerce")
-    h = h.dropna().sort_values("timestamp")
+    h = history.copy()
     h["pnl"] = h["value_ghs"] - invested
 
     return h
 
 
 def load_crypto_holdings(user_id):
-    holdings = {k: 0.0 for k in API_MAP}
-
-    try:
-        res = (
-            db()
-            .table("crypto_holdings")
-            .select("symbol,quantity")
-            .eq("user_id", user_id)
-            .execute()
-        )
-
-        for r in res.data or []:
-            symbol = r["symbol"]
-            if symbol in holdings:
-                holdings[symbol] = float(r["quantity"])
-
-    except Exception:
-        pass
-
-    return holdings
+    return load_holdings("crypto_holdings", user_id, API_MAP)
 
 
 def save_crypto_holdings(user_id, holdings):
-    rows = [
-        {"user_id": user_id, "symbol": k, "quantity": float(v)}
-        for k, v in holdings.items()
-    ]
-
-    db().table("crypto_holdings").upsert(
-        rows,
-        on_conflict="user_id,symbol",
-    ).execute()
+    return save_holdings("crypto_holdings", user_id, holdings)
 
 
 def load_portfolio_history(user_id):
-    try:
-        res = (
-            db()
-            .table("portfolio_history")
-            .select("timestamp,value_ghs")
-            .eq("user_id", user_id)
-            .eq("mode", "crypto")
-            .order("timestamp")
-            .execute()
-        )
-        return res.data or []
-
-    except Exception:
-        return []
+    return load_history(user_id, "crypto", year_to_date=True)
 
 
 def metric_delta(value):
@@ -410,7 +317,7 @@ def crypto_app():
             st.success("Crypto holdings saved")
 
     try:
-        prices = crypto_live_prices() or {}
+        prices = crypto_live_prices(held_symbols(holdings)) or {}
     except Exception:
         prices = {}
 
@@ -422,6 +329,13 @@ def crypto_app():
     value_col = f"Value ({currency_code})"
 
     for sym, qty in holdings.items():
+        if float(qty or 0.0) <= 0:
+            # Only held symbols are priced; leave the others blank
+            # rather than showing a price of zero.
+            price = prices.get(sym)
+            rows.append([sym, qty, None if price is None else round(price, 6), 0.0])
+            continue
+
         raw_price = prices.get(
             sym,
             1.0 if sym in ["USDT", "USDC", "DAI"] else 0.0
@@ -468,6 +382,7 @@ def crypto_app():
     )
 
     df[value_col] = pd.to_numeric(df[value_col], errors="coerce").fillna(0.0)
+    df["Price (USD)"] = pd.to_numeric(df["Price (USD)"], errors="coerce")
 
     top_df = (
         df[df[value_col] > 0]
@@ -493,12 +408,9 @@ def crypto_app():
     mtd_pct = 0.0
     ytd_pct = 0.0
 
-    if history and len(history) >= 2:
+    if len(history) >= 2:
         try:
-            h = pd.DataFrame(history)
-            h["timestamp"] = pd.to_datetime(h["timestamp"], errors="coerce")
-            h["value_ghs"] = pd.to_numeric(h["value_ghs"], errors="coerce")
-            h = h.dropna().sort_values("timestamp")
+            h = history
 
             if not h.empty:
                 now = datetime.utcnow()
@@ -563,11 +475,10 @@ def crypto_app():
 
     st.subheader("📈 Portfolio Trend")
 
-    if len(history) >= 2:
-        h = pd.DataFrame(history)
-        h["timestamp"] = pd.to_datetime(h["timestamp"], errors="coerce")
-        h["value_ghs"] = pd.to_numeric(h["value_ghs"], errors="coerce")
-        h = h.dropna()
+    chart_history = load_chart_history(user_id, "crypto")
+
+    if len(chart_history) >= 2:
+        h = chart_history
 
         fig = go.Figure()
 
@@ -598,7 +509,7 @@ def crypto_app():
 
     st.subheader("📊 All-Time PnL Curve")
 
-    pnl_df = build_pnl_history(history, invested)
+    pnl_df = build_pnl_history(chart_history, invested)
 
     if len(pnl_df) >= 2:
         fig = go.Figure()
@@ -1,7 +1,12 @@
 # db.py
+import importlib.util
 import os
 import streamlit as st
-from supabase import create_client, Client
+import threading
+import httpx
+from supabase import create_client, Client, ClientOptions
+
+from query_stats import InstrumentedClient, QueryLog, render_query_panel
 
 
 # -----------------------------------------
@@ -27,9 +32,67 @@ def get_secret(key: str, default=None):
 SUPABASE_URL = get_secret("SUPABASE_URL")
 SUPABASE_KEY = get_secret("SUPABASE_ANON_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
+# SUPABASE_BACKEND=memory swaps every client for the in-memory stand-in
+# in fake_supabase.py (tests, benchmarks, offline demos). Optional
+# SUPABASE_FAKE_LATENCY_MS adds a delay to each fake query.
+USE_FAKE_BACKEND = str(get_secret("SUPABASE_BACKEND", "")).lower() == "memory"
+
+if USE_FAKE_BACKEND:
+    import fake_supabase
+
+    fake_supabase.backend.latency = (
+        float(get_secret("SUPABASE_FAKE_LATENCY_MS", 0) or 0) / 1000
+    )
+
+elif not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("❌ Supabase credentials not found.")
 
+# Optional. Lets background jobs write for many users in one request.
+SUPABASE_SERVICE_KEY = get_secret("SUPABASE_SERVICE_ROLE_KEY")
+
+
+# -----------------------------------------
+# SHARED HTTP TRANSPORT
+# One keep-alive (HTTP/2 when h2 is installed)
+# connection pool for every Supabase client in
+# the process. Users stay isolated because each
+# client sends its own auth headers per request.
+# -----------------------------------------
+SUPABASE_HTTP_TIMEOUT = 20
+SUPABASE_MAX_CONNECTIONS = 50
+SUPABASE_KEEPALIVE_SECONDS = 60
+
+_http_client = None
+_http_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+
+    with _http_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                http2=importlib.util.find_spec("h2") is not None,
+                timeout=SUPABASE_HTTP_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=SUPABASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=SUPABASE_MAX_CONNECTIONS,
+                    keepalive_expiry=SUPABASE_KEEPALIVE_SECONDS,
+                ),
+            )
+
+    return _http_client
+
+
+def pooled_options(headers=None) -> ClientOptions:
+    options = ClientOptions(httpx_client=get_http_client())
+
+    if headers:
+        options.headers.update(headers)
+
+    return options
+
 
 # -----------------------------------------
 # SESSION-ISOLATED CLIENT
@@ -41,17 +104,111 @@ def get_supabase() -> Client:
     - Account leakage
     - Random logout
     - Save failures
+
+    The client only holds the session's auth state; connections come
+    from the shared pool. Its calls are recorded in its query_log.
     """
 
     if "supabase_client" not in st.session_state:
-        st.session_state.supabase_client = create_client(
-            SUPABASE_URL,
-            SUPABASE_KEY
+        if USE_FAKE_BACKEND:
+            client = fake_supabase.create_fake_client()
+        else:
+            client = create_client(
+                SUPABASE_URL,
+                SUPABASE_KEY,
+                options=pooled_options(),
+            )
+
+        st.session_state.supabase_client = InstrumentedClient(
+            client,
+            QueryLog("session"),
         )
 
     return st.session_state.supabase_client
 
 
+def start_query_log():
+    """
+    Reset the session's query log; call once at the top of each rerun.
+    """
+    get_supabase().query_log.start()
+
+
+def finish_query_log():
+    """
+    Print this rerun's query summary and show the sidebar panel when
+    DEBUG is on.
+    """
+    if not debug_enabled():
+        return
+
+    log = get_supabase().query_log
+    log.log_summary()
+    render_query_panel(log)
+
+
+# -----------------------------------------
+# BACKGROUND CLIENTS (NO SESSION STATE)
+# -----------------------------------------
+_service_client = None
+_service_lock = threading.Lock()
+
+# Calls made outside any rerun (queued writes, mirror sync).
+background_query_log = QueryLog("background")
+
+
+def get_service_client():
+    """
+    Process-wide service-role client, or None when no service key is
+    configured. Bypasses RLS, so only use it for rows whose user_id was
+    taken from an authenticated session.
+    """
+    global _service_client
+
+    if USE_FAKE_BACKEND:
+        return InstrumentedClient(
+            fake_supabase.create_fake_client(),
+            background_query_log,
+        )
+
+    if not SUPABASE_SERVICE_KEY:
+        return None
+
+    with _service_lock:
+        if _service_client is None:
+            _service_client = InstrumentedClient(
+                create_client(
+                    SUPABASE_URL,
+                    SUPABASE_SERVICE_KEY,
+                    options=pooled_options(),
+                ),
+                background_query_log,
+            )
+
+    return _service_client
+
+
+def create_token_client(access_token: str) -> Client:
+    """
+    Client that acts as the user owning `access_token`, for work done
+    outside the user's script run (e.g. queued writes).
+    """
+    if USE_FAKE_BACKEND:
+        client = fake_supabase.create_fake_client(access_token)
+
+    elif not access_token:
+        client = create_client(SUPABASE_URL, SUPABASE_KEY, options=pooled_options())
+
+    else:
+        client = create_client(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            options=pooled_options({"Authorization": f"Bearer {access_token}"}),
+        )
+
+    return InstrumentedClient(client, background_query_log)
+
+
 # -----------------------------------------
 # GLOBAL ACCESSOR
 # -----------------------------------------
@@ -61,12 +218,14 @@ supabase: Client = get_supabase()
 # -----------------------------------------
 # ERROR LOGGER
 # -----------------------------------------
+def debug_enabled() -> bool:
+    return str(get_secret("DEBUG", False)).lower() in ["true", "1", "yes"]
+
+
 def log_supabase_error(context: str, err: Exception):
     st.error(f"Supabase error in {context}")
 
-    debug = get_secret("DEBUG", False)
-
-    if str(debug).lower() in ["true", "1", "yes"]:
+    if debug_enabled():
         st.exception(err)
 
 
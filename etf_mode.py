@@ -3,9 +3,11 @@ import pandas as pd
 from datetime import datetime
 import plotly.graph_objects as go
 
-from price_history import stock_live_prices
-from portfolio_tracker import autosave_portfolio_value
-from db import get_supabase
+from price_history import held_symbols, stock_live_prices
+from portfolio_tracker import autosave_portfolio_value, manual_snapshot
+from history_store import load_chart_history, load_history
+from holdings_store import load_holdings, save_holdings
+from settings_store import load_setting, save_setting
 
 
 ETF_MAP = {
@@ -61,33 +63,8 @@ DONUT_CHART_CONFIG = {
 }
 
 
-def db():
-    supabase = get_supabase()
-
-    if "access_token" in st.session_state:
-        try:
-            supabase.auth.set_session(
-                access_token=st.session_state.access_token,
-                refresh_token=st.session_state.refresh_token,
-            )
-        except Exception:
-            pass
-
-    return supabase
-
-
 def force_snapshot(user_id, value_ghs, mode="etf"):
-    try:
-        db().table("portfolio_history").insert({
-            "user_id": user_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "value_ghs": round(float(value_ghs), 2),
-            "mode": mode,
-        }).execute()
-        return True
-    except Exception as e:
-        print("Force snapshot failed:", e)
-        return False
+    return manual_snapshot(user_id, value_ghs, mode)
 
 
 def safe_price(symbol, price):
@@ -114,23 +91,6 @@ def set_last_good_value(value):
     st.session_state.etf_last_good_value = value
 
 
-def clean_history(history):
-    if not history:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(history)
-
-    if df.empty:
-        return df
-
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    df["value_ghs"] = pd.to_numeric(df["value_ghs"], errors="coerce")
-    df = df.dropna()
-    df = df.sort_values("timestamp")
-
-    return df
-
-
 def build_pnl(df, invested):
     if df.empty:
         return df
@@ -141,29 +101,6 @@ def build_pnl(df, invested):
     return df
 
 
-def load_setting(user_id, key, default):
-    try:
-        res = (
-            db()
-            .table("user_settings")
-            .select("value")
-            .eq("user_id", user_id)
-            .eq("key", key)
-            .single()
-            .execute()
-        )
-        return float(res.data["value"])
-    except Exception:
-        return default
-
-
-def save_setting(user_id, key, value):
-    db().table("user_settings").upsert(
-        {"user_id": user_id, "key": key, "value": float(value)},
-        on_conflict="user_id,key",
-    ).execute()
-
-
 def currency_label(currency):
     return f'{currency["code"]} - {currency["name"]}'
 
@@ -178,54 +115,15 @@ def fmt(v, currency):
 
 
 def load_etf_holdings(user_id):
-    holdings = {k: 0.0 for k in ETF_MAP}
-
-    try:
-        res = (
-            db()
-            .table("etf_holdings")
-            .select("symbol,quantity")
-            .eq("user_id", user_id)
-            .execute()
-        )
-
-        for r in res.data or []:
-            symbol = r["symbol"]
-            if symbol in holdings:
-                holdings[symbol] = float(r["quantity"])
-
-    except Exception:
-        pass
-
-    return holdings
+    return load_holdings("etf_holdings", user_id, ETF_MAP)
 
 
 def save_etf_holdings(user_id, holdings):
-    rows = [
-        {"user_id": user_id, "symbol": k, "quantity": float(v)}
-        for k, v in holdings.items()
-    ]
-
-    db().table("etf_holdings").upsert(
-        rows,
-        on_conflict="user_id,symbol",
-    ).execute()
+    return save_holdings("etf_holdings", user_id, holdings)
 
 
 def load_portfolio_history(user_id):
-    try:
-        res = (
-            db()
-            .table("portfolio_history")
-            .select("timestamp,value_ghs")
-            .eq("user_id", user_id)
-            .eq("mode", "etf")
-            .order("timestamp")
-            .execute()
-        )
-        return res.data or []
-    except Exception:
-        return []
+    return load_history(user_id, "etf", year_to_date=True)
 
 
 def metric_delta(v):
@@ -420,7 +318,7 @@ def etf_app():
             st.success("ETF holdings saved")
 
     try:
-        prices = stock_live_prices(list(ETF_MAP.keys())) or {}
+        prices = stock_live_prices(held_symbols(holdings)) or {}
     except Exception:
         prices = {}
 
@@ -432,6 +330,12 @@ def etf_app():
     value_col = f"Value ({currency_code})"
 
     for sym, qty in holdings.items():
+        if float(qty or 0.0) <= 0:
+            # Only held symbols are priced; leave the others blank
+            # rather than showing a price of zero.
+            rows.append([sym, qty, prices.get(sym), 0.0])
+            continue
+
         raw = prices.get(sym, 0.0)
         price, ok = safe_price(sym, raw)
 
@@ -473,6 +377,7 @@ def etf_app():
     )
 
     df[value_col] = pd.to_numeric(df[value_col], errors="coerce").fillna(0.0)
+    df["Price (USD)"] = pd.to_numeric(df["Price (USD)"], errors="coerce")
 
     top_df = (
         df[df[value_col] > 0]
@@ -491,7 +396,7 @@ def etf_app():
     top2.metric("Invested", fmt(invested, selected_currency))
     top3.metric("PnL", fmt(pnl, selected_currency), metric_delta(pnl_pct))
 
-    history = clean_history(load_portfolio_history(user_id))
+    history = load_portfolio_history(user_id)
 
     mtd_pnl = ytd_pnl = 0.0
     mtd_pct = ytd_pct = 0.0
@@ -540,12 +445,14 @@ def etf_app():
 
     st.subheader("Portfolio Trend")
 
-    if len(history) >= 2:
+    chart_history = load_chart_history(user_id, "etf")
+
+    if len(chart_history) >= 2:
         fig = go.Figure()
 
         fig.add_trace(go.Scatter(
-            x=history["timestamp"],
-            y=history["value_ghs"],
+            x=chart_history["timestamp"],
+            y=chart_history["value_ghs"],
             mode="lines",
             fill="tozeroy",
             line=dict(shape="spline", smoothing=1.2, width=3),
@@ -568,7 +475,7 @@ def etf_app():
 
     st.subheader("All-Time PnL Curve")
 
-    pnl_df = build_pnl(history, invested)
+    pnl_df = build_pnl(chart_history, invested)
 
     if len(pnl_df) >= 2:
         fig = go.Figure()
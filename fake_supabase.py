@@ -0,0 +1,522 @@
+# fake_supabase.py
+import base64
+import copy
+import itertools
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+
+# -----------------------------------------
+# IN-MEMORY SUPABASE STAND-IN
+# Implements the PostgREST subset the app uses
+# (select / eq / gte / in_ / or_ / order / limit
+# / single, insert, upsert with on_conflict,
+# update, delete, rpc) plus the auth calls made
+# by auth.py. Enabled with SUPABASE_BACKEND=memory.
+# -----------------------------------------
+class FakeAPIError(Exception):
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+def make_token(user_id, ttl=3600):
+    """
+    Unsigned JWT-shaped token; enough for the expiry checks in auth.py.
+    """
+    claims = {"sub": user_id, "exp": int(time.time()) + ttl, "role": "authenticated"}
+    return f"{_b64({'alg': 'none', 'typ': 'JWT'})}.{_b64(claims)}.fake"
+
+
+def _token_user(token):
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("sub")
+    except Exception:
+        return None
+
+
+# -----------------------------------------
+# BACKEND (SHARED BY ALL FAKE CLIENTS)
+# -----------------------------------------
+class FakeBackend:
+    """
+    Tables are lists of dict rows. Every executed query is recorded as
+    (table, op, rows, seconds); `latency` (seconds, or a callable taking
+    table and op) is slept before each query to mimic network cost.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.users = {}
+        self.calls = []
+        self.rpcs = {"get_user_positions": _rpc_user_positions}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def seed(self, table, rows):
+        with self._lock:
+            for row in rows:
+                self._insert_row(table, dict(row))
+
+    def rows(self, table):
+        with self._lock:
+            return [dict(row) for row in self.tables.get(table, [])]
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = []
+
+    def query_count(self, table=None, op=None):
+        return sum(
+            1
+            for call_table, call_op, _, _ in self.calls
+            if (table is None or call_table == table)
+            and (op is None or call_op == op)
+        )
+
+    def _sleep(self, table, op):
+        latency = self.latency(table, op) if callable(self.latency) else self.latency
+
+        if latency:
+            time.sleep(latency)
+
+    def _record(self, table, op, rows, started):
+        with self._lock:
+            self.calls.append((table, op, rows, time.perf_counter() - started))
+
+    def _insert_row(self, table, row):
+        row.setdefault("id", next(self._ids))
+        row.setdefault("created_at", datetime.utcnow().isoformat())
+        self.tables.setdefault(table, []).append(row)
+        return row
+
+
+# -----------------------------------------
+# FILTERS
+# -----------------------------------------
+def _coerce(value, sample):
+    if isinstance(sample, bool):
+        return str(value).lower() == "true"
+
+    if isinstance(sample, (int, float)) and not isinstance(value, (int, float)):
+        try:
+            return type(sample)(value)
+        except (TypeError, ValueError):
+            return value
+
+    return value
+
+
+OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+}
+
+
+def _match(row, column, op, value):
+    actual = row.get(column)
+
+    if op == "in":
+        return actual in [_coerce(v, actual) for v in value]
+
+    return OPERATORS[op](actual, _coerce(value, actual))
+
+
+def _split_top_level(expr):
+    parts, depth, current, quoted = [], 0, "", False
+
+    for char in expr:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+
+        current += char
+
+    if current:
+        parts.append(current)
+
+    return parts
+
+
+def _parse_logic(expr, combine):
+    """
+    Turn a PostgREST logic expression ("a.eq.1,and(b.gt.2,c.lt.3)")
+    into a row predicate.
+    """
+    tests = []
+
+    for part in _split_top_level(expr):
+        if part.startswith(("and(", "or(")):
+            inner = part[part.index("(") + 1:-1]
+            tests.append(_parse_logic(inner, all if part.startswith("and") else any))
+            continue
+
+        column, op, value = part.split(".", 2)
+        value = value.strip('"')
+        tests.append(lambda row, c=column, o=op, v=value: _match(row, c, o, v))
+
+    return lambda row: combine(test(row) for test in tests)
+
+
+# -----------------------------------------
+# QUERY BUILDER
+# -----------------------------------------
+class FakeQuery:
+
+    def __init__(self, client, table):
+        self._client = client
+        self._backend = client.backend
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._payload = None
+        self._on_conflict = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._single = False
+
+    # ---------- operations ----------
+    def select(self, columns="*", count=None):
+        self._op, self._columns = "select", columns
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict="", **kwargs):
+        self._op, self._payload = "upsert", rows
+        self._on_conflict = [c.strip() for c in on_conflict.split(",") if c.strip()]
+        return self
+
+    def update(self, values):
+        self._op, self._payload = "update", values
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # ---------- filters ----------
+    def _filter(self, column, op, value):
+        self._filters.append(lambda row: _match(row, column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "in", list(values))
+
+    def or_(self, expr):
+        self._filters.append(_parse_logic(expr, any))
+        return self
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self._limit = size
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    # ---------- execution ----------
+    def _matching(self, rows):
+        return [row for row in rows if all(test(row) for test in self._filters)]
+
+    def _project(self, row):
+        if self._columns.strip() == "*":
+            return copy.deepcopy(row)
+
+        return {
+            column.strip(): copy.deepcopy(row.get(column.strip()))
+            for column in self._columns.split(",")
+        }
+
+    def execute(self):
+        backend = self._backend
+        started = time.perf_counter()
+        backend._sleep(self._table, self._op)
+
+        with backend._lock:
+            table = backend.tables.setdefault(self._table, [])
+            data = getattr(self, f"_run_{self._op}")(table)
+
+        backend._record(self._table, self._op, len(data), started)
+
+        if self._single:
+            if len(data) != 1:
+                raise FakeAPIError(
+                    "JSON object requested, multiple (or no) rows returned",
+                    code="PGRST116",
+                )
+            data = data[0]
+
+        return SimpleNamespace(data=data, count=None)
+
+    def _run_select(self, table):
+        rows = self._matching(table)
+
+        for column, desc in reversed(self._order):
+            rows.sort(
+                key=lambda row: (row.get(column) is None, row.get(column)),
+                reverse=desc,
+            )
+
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        return [self._project(row) for row in rows]
+
+    def _payload_rows(self):
+        rows = self._payload
+        return [dict(row) for row in (rows if isinstance(rows, list) else [rows])]
+
+    def _run_insert(self, table):
+        return [
+            copy.deepcopy(self._backend._insert_row(self._table, row))
+            for row in self._payload_rows()
+        ]
+
+    def _run_upsert(self, table):
+        keys = self._on_conflict or ["id"]
+        result = []
+
+        for row in self._payload_rows():
+            existing = next(
+                (
+                    current
+                    for current in table
+                    if all(k in row and current.get(k) == row[k] for k in keys)
+                ),
+                None,
+            )
+
+            if existing is None:
+                existing = self._backend._insert_row(self._table, row)
+            else:
+                existing.update(row)
+
+            result.append(copy.deepcopy(existing))
+
+        return result
+
+    def _run_update(self, table):
+        rows = self._matching(table)
+
+        for row in rows:
+            row.update(self._payload)
+
+        return [copy.deepcopy(row) for row in rows]
+
+    def _run_delete(self, table):
+        doomed = self._matching(table)
+        table[:] = [row for row in table if row not in doomed]
+        return [copy.deepcopy(row) for row in doomed]
+
+
+# -----------------------------------------
+# AUTH
+# -----------------------------------------
+class FakeAuth:
+
+    def __init__(self, client):
+        self._client = client
+        self._session = None
+
+    def _new_session(self, user):
+        self._session = SimpleNamespace(
+            access_token=make_token(user.id),
+            refresh_token=uuid.uuid4().hex,
+            user=user,
+        )
+        self._client.user_id = user.id
+        return SimpleNamespace(user=user, session=self._session)
+
+    def _user(self, user_id):
+        for user in self._client.backend.users.values():
+            if user["user"].id == user_id:
+                return user["user"]
+        return None
+
+    def sign_up(self, credentials):
+        users = self._client.backend.users
+        email = credentials["email"]
+
+        if email in users:
+            raise FakeAPIError("User already registered")
+
+        user = SimpleNamespace(id=str(uuid.uuid4()), email=email)
+        users[email] = {"user": user, "password": credentials["password"]}
+
+        return self._new_session(user)
+
+    def sign_in_with_password(self, credentials):
+        entry = self._client.backend.users.get(credentials["email"])
+
+        if not entry or entry["password"] != credentials["password"]:
+            raise FakeAPIError("Invalid login credentials")
+
+        return self._new_session(entry["user"])
+
+    def set_session(self, access_token, refresh_token):
+        user = self._user(_token_user(access_token))
+
+        if user is None:
+            raise FakeAPIError("Invalid token")
+
+        self._session = SimpleNamespace(
+            access_token=access_token,
+            refresh_token=refresh_token,
+            user=user,
+        )
+        self._client.user_id = user.id
+
+        return SimpleNamespace(user=user, session=self._session)
+
+    def refresh_session(self, refresh_token=None):
+        if self._session is None:
+            raise FakeAPIError("No session")
+
+        return self._new_session(self._session.user)
+
+    def get_session(self):
+        return self._session
+
+    def get_user(self, jwt=None):
+        token = jwt or (self._session.access_token if self._session else None)
+        user = self._user(_token_user(token)) if token else None
+
+        return SimpleNamespace(user=user) if user else None
+
+    def sign_out(self):
+        self._session = None
+        self._client.user_id = None
+
+
+# -----------------------------------------
+# CLIENT
+# -----------------------------------------
+class FakeSupabase:
+    """
+    Drop-in for supabase.Client. `user_id` plays the part of auth.uid()
+    for RPCs; row-level security is not emulated.
+    """
+
+    def __init__(self, backend, user_id=None):
+        self.backend = backend
+        self.user_id = user_id
+        self.auth = FakeAuth(self)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, name, params=None):
+        handler = self.backend.rpcs.get(name)
+
+        if handler is None:
+            raise FakeAPIError(f"Could not find the function {name}", code="PGRST202")
+
+        client = self
+
+        class _Call:
+            def execute(self):
+                started = time.perf_counter()
+                client.backend._sleep(name, "rpc")
+
+                with client.backend._lock:
+                    data = handler(client, **(params or {}))
+
+                client.backend._record(name, "rpc", len(data), started)
+                return SimpleNamespace(data=data, count=None)
+
+        return _Call()
+
+
+def _rpc_user_positions(client):
+    backend = client.backend
+    rows = []
+
+    for asset_class in ["crypto", "stock", "etf"]:
+        for row in backend.tables.get(f"{asset_class}_holdings", []):
+            if row.get("user_id") == client.user_id and float(row.get("quantity") or 0) > 0:
+                rows.append({
+                    "asset_class": asset_class,
+                    "symbol": row["symbol"],
+                    "quantity": row["quantity"],
+                    "details": None,
+                    "position": 0,
+                })
+
+    bonds = sorted(
+        (r for r in backend.tables.get("bond_holdings", []) if r.get("user_id") == client.user_id),
+        key=lambda r: r.get("created_at") or "",
+    )
+
+    for position, row in enumerate(bonds, start=1):
+        details = {k: v for k, v in row.items() if k != "user_id"}
+        rows.append({
+            "asset_class": "bond",
+            "symbol": row.get("name"),
+            "quantity": 1,
+            "details": details,
+            "position": position,
+        })
+
+    return rows
+
+
+# -----------------------------------------
+# PROCESS-WIDE BACKEND
+# -----------------------------------------
+backend = FakeBackend()
+
+
+def create_fake_client(access_token=None):
+    return FakeSupabase(backend, _token_user(access_token) if access_token else None)
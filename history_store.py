@@ -0,0 +1,404 @@
+# history_store.py
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+
+from auth import get_auth_client
+from local_mirror import get_mirror
+from portfolio_tracker import SNAPSHOT_BUCKET_SECONDS
+
+
+# -----------------------------------------
+# SESSION HISTORY CACHE
+# The parsed, sorted portfolio_history series
+# of each mode stays in the session; reruns
+# only fetch rows newer than the last one seen.
+# -----------------------------------------
+HISTORY_CACHE_KEY = "portfolio_history_cache"
+
+# Minimum gap between two delta queries for the same mode.
+HISTORY_DELTA_SECONDS = 15
+
+# A full reload now and then picks up deletes and compaction.
+HISTORY_RESYNC_SECONDS = 1800
+
+# Autosaves upsert into the current time bucket, so the delta
+# re-reads one bucket behind the newest row to catch updates.
+HISTORY_DELTA_OVERLAP = timedelta(seconds=SNAPSHOT_BUCKET_SECONDS)
+
+HISTORY_COLUMNS = ["timestamp", "value_ghs"]
+
+
+def year_start(now=None):
+    now = now or datetime.utcnow()
+    return datetime(now.year, 1, 1)
+
+
+# -----------------------------------------
+# KEYSET-PAGINATED LOADING
+# Pages walk (timestamp, id) so long histories
+# are never cut off by the API row limit.
+# -----------------------------------------
+
+# Must not exceed the project's API "max rows" setting, or a short
+# page would be mistaken for the last one.
+HISTORY_PAGE_SIZE = 1000
+
+
+class HistoryBuffer:
+    """
+    Column lists that pages are appended to; parsed into a DataFrame
+    once at the end instead of building one frame per page.
+    """
+
+    def __init__(self):
+        self.timestamps = []
+        self.values = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def extend(self, rows):
+        for row in rows:
+            self.timestamps.append(row.get("timestamp"))
+            self.values.append(row.get("value_ghs"))
+
+    def to_frame(self):
+        if not self.timestamps:
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+        df = pd.DataFrame(
+            {
+                "timestamp": pd.to_datetime(self.timestamps, errors="coerce"),
+                "value_ghs": pd.to_numeric(self.values, errors="coerce"),
+            }
+        )
+
+        return df.dropna().sort_values("timestamp").reset_index(drop=True)
+
+
+def iter_history_pages(
+    user_id,
+    mode,
+    since=None,
+    page_size=HISTORY_PAGE_SIZE,
+    client=None,
+):
+    """
+    Yield lists of portfolio_history rows in (timestamp, id) order,
+    at most `page_size` rows per request.
+    """
+    client = client or get_auth_client()
+    cursor = None
+
+    while True:
+        query = (
+            client.table("portfolio_history")
+            .select("id,timestamp,value_ghs")
+            .eq("user_id", user_id)
+            .eq("mode", mode)
+        )
+
+        if since is not None:
+            query = query.gte("timestamp", since.isoformat())
+
+        if cursor is not None:
+            ts, row_id = cursor
+            query = query.or_(
+                f'timestamp.gt."{ts}",'
+                f'and(timestamp.eq."{ts}",id.gt.{row_id})'
+            )
+
+        rows = (
+            query.order("timestamp")
+            .order("id")
+            .limit(page_size)
+            .execute()
+            .data
+            or []
+        )
+
+        if rows:
+            yield rows
+
+        if len(rows) < page_size:
+            return
+
+        cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+
+
+def fetch_history(user_id, mode, since=None, client=None):
+    """
+    With an explicit `client` no session state is touched, so it can
+    run off the script thread; see plan_history and store_history.
+    """
+    buffer = HistoryBuffer()
+
+    for rows in iter_history_pages(user_id, mode, since, client=client):
+        buffer.extend(rows)
+
+    return buffer.to_frame()
+
+
+def merge_history(frame, delta):
+    """
+    Append newly fetched rows; a timestamp seen again keeps its
+    latest value.
+    """
+    if delta.empty:
+        return frame
+
+    if frame.empty:
+        return delta.reset_index(drop=True)
+
+    merged = pd.concat([frame, delta], ignore_index=True)
+
+    return (
+        merged.drop_duplicates("timestamp", keep="last")
+        .sort_values("timestamp")
+        .reset_index(drop=True)
+    )
+
+
+def plan_history(user_id, mode, start=None, refresh=False):
+    """
+    What load_history has to fetch next: None while the session copy
+    is fresh, otherwise (full, since) for fetch_history. A cold session
+    is seeded from the mirror first.
+    """
+    caches = st.session_state.setdefault(HISTORY_CACHE_KEY, {})
+    key = (user_id, mode, start)
+    cache = caches.get(key)
+    now = time.time()
+
+    mirror = get_mirror()
+
+    if cache is None and not refresh and mirror is not None:
+        # Cold session: start from the local copy, then sync the delta.
+        cache = caches[key] = {
+            "frame": mirror.history(user_id, mode, since=start),
+            "synced_at": now,
+            "checked_at": 0.0,
+        }
+
+    if (
+        refresh
+        or cache is None
+        or now - cache["synced_at"] >= HISTORY_RESYNC_SECONDS
+    ):
+        return True, start
+
+    if now - cache["checked_at"] < HISTORY_DELTA_SECONDS:
+        return None
+
+    frame = cache["frame"]
+    since = start
+
+    if not frame.empty:
+        since = frame["timestamp"].iloc[-1] - HISTORY_DELTA_OVERLAP
+
+    return False, since
+
+
+def session_history(user_id, mode, start=None):
+    cache = st.session_state.get(HISTORY_CACHE_KEY, {}).get((user_id, mode, start))
+
+    return cache["frame"] if cache else HistoryBuffer().to_frame()
+
+
+def store_history(user_id, mode, full, frame, start=None):
+    """
+    Apply a fetch planned by plan_history to the session copy (and the
+    mirror) and return the updated history.
+    """
+    caches = st.session_state.setdefault(HISTORY_CACHE_KEY, {})
+    key = (user_id, mode, start)
+    now = time.time()
+    mirror = get_mirror()
+
+    if full:
+        if mirror is not None and start is None:
+            mirror.store_history(user_id, mode, frame, replace=True)
+
+        caches[key] = {
+            "frame": frame.reset_index(drop=True),
+            "synced_at": now,
+            "checked_at": now,
+        }
+        return caches[key]["frame"]
+
+    cache = caches[key]
+    cache["frame"] = merge_history(cache["frame"], frame)
+    cache["checked_at"] = now
+
+    if mirror is not None:
+        mirror.store_history(user_id, mode, frame)
+
+    return cache["frame"]
+
+
+def load_history(user_id, mode, refresh=False, year_to_date=False):
+    """
+    Return the user's history for `mode` as a clean DataFrame. The
+    frame is shared with later reruns, so treat it as read-only.
+
+    With `year_to_date` only rows since 1 January are loaded, which is
+    all the MTD/YTD figures need.
+    """
+    start = year_start() if year_to_date else None
+    plan = plan_history(user_id, mode, start, refresh)
+
+    if plan is None:
+        return session_history(user_id, mode, start)
+
+    full, since = plan
+
+    try:
+        frame = fetch_history(user_id, mode, since)
+    except Exception as error:
+        if full:
+            print("Load history failed:", error)
+        else:
+            print("History delta sync failed:", error)
+
+        return session_history(user_id, mode, start)
+
+    return store_history(user_id, mode, full, frame, start)
+
+
+# -----------------------------------------
+# CHART HISTORY (SERVER-SIDE ROLLUPS)
+# portfolio_history_rollup holds hourly, daily
+# and weekly OHLC rows (migrations/002). Charts
+# use the finest resolution that still fits in
+# HISTORY_CHART_POINTS over the whole range.
+# -----------------------------------------
+ROLLUP_RESOLUTIONS = (
+    ("hour", 3600),
+    ("day", 86400),
+    ("week", 7 * 86400),
+)
+
+HISTORY_CHART_POINTS = 500
+CHART_CACHE_KEY = "portfolio_chart_cache"
+CHART_CACHE_SECONDS = 60
+
+
+def chart_resolution(span_seconds, max_points=HISTORY_CHART_POINTS):
+    if span_seconds / SNAPSHOT_BUCKET_SECONDS <= max_points:
+        return "raw"
+
+    for name, step in ROLLUP_RESOLUTIONS:
+        if span_seconds / step <= max_points:
+            return name
+
+    return ROLLUP_RESOLUTIONS[-1][0]
+
+
+def _rollup_query(client, user_id, mode, resolution):
+    return (
+        client.table("portfolio_history_rollup")
+        .select("bucket,close")
+        .eq("user_id", user_id)
+        .eq("mode", mode)
+        .eq("resolution", resolution)
+    )
+
+
+def fetch_rollup(user_id, mode, resolution, client=None):
+    rows = (
+        _rollup_query(client or get_auth_client(), user_id, mode, resolution)
+        .order("bucket")
+        .limit(HISTORY_PAGE_SIZE)
+        .execute()
+        .data
+        or []
+    )
+
+    buffer = HistoryBuffer()
+    buffer.extend(
+        {"timestamp": row["bucket"], "value_ghs": row["close"]}
+        for row in rows
+    )
+
+    return buffer.to_frame()
+
+
+def _first_bucket(user_id, mode, client=None):
+    rows = (
+        _rollup_query(client or get_auth_client(), user_id, mode, "week")
+        .order("bucket")
+        .limit(1)
+        .execute()
+        .data
+    )
+
+    if not rows:
+        return None
+
+    return pd.to_datetime(rows[0]["bucket"], utc=True)
+
+
+def fetch_chart_rollup(client, user_id, mode):
+    """
+    Rollup frame for the charts, or None when raw history should be
+    used (rollup table missing or empty, or a short span). Touches no
+    session state; pass the result to cache_chart_history.
+    """
+    try:
+        first = _first_bucket(user_id, mode, client)
+    except Exception:
+        return None
+
+    if first is None:
+        return None
+
+    span = (pd.Timestamp.now(tz="UTC") - first).total_seconds()
+    resolution = chart_resolution(span)
+
+    if resolution == "raw":
+        return None
+
+    try:
+        return fetch_rollup(user_id, mode, resolution, client)
+    except Exception as error:
+        print("Load rollup history failed:", error)
+        return None
+
+
+def cached_chart_history(user_id, mode):
+    """
+    (hit, frame) from the session chart cache. A cached frame of None
+    means "use raw history", so that check is not repeated every rerun.
+    """
+    cache = st.session_state.get(CHART_CACHE_KEY, {}).get((user_id, mode))
+
+    if cache and time.time() - cache["loaded_at"] < CHART_CACHE_SECONDS:
+        return True, cache["frame"]
+
+    return False, None
+
+
+def cache_chart_history(user_id, mode, frame):
+    caches = st.session_state.setdefault(CHART_CACHE_KEY, {})
+    caches[(user_id, mode)] = {"frame": frame, "loaded_at": time.time()}
+
+
+def load_chart_history(user_id, mode):
+    """
+    (timestamp, value_ghs) points for trend/PnL charts, each value the
+    close of its bucket. Falls back to raw history when the rollup
+    table is missing or still empty.
+    """
+    hit, frame = cached_chart_history(user_id, mode)
+
+    if not hit:
+        frame = fetch_chart_rollup(get_auth_client(), user_id, mode)
+        cache_chart_history(user_id, mode, frame)
+
+    if frame is None:
+        return load_history(user_id, mode)
+
+    return frame
@@ -0,0 +1,267 @@
+# holdings_store.py
+import time
+
+import streamlit as st
+
+from auth import get_auth_client
+from local_mirror import get_mirror
+
+
+# -----------------------------------------
+# DIFF-BASED HOLDINGS PERSISTENCE
+# The rows read by load_holdings are kept as
+# the session's baseline; save_holdings only
+# upserts symbols whose quantity changed and
+# deletes positions that went to zero.
+# -----------------------------------------
+HOLDINGS_BASELINE_KEY = "holdings_baseline"
+
+
+def diff_holdings(stored, holdings):
+    """
+    Compare stored {symbol: qty} rows with the edited holdings.
+    Returns (changed {symbol: qty}, removed [symbol]). Zero quantities
+    are never written; a stored row that is now zero is removed.
+    """
+    changed = {}
+    removed = []
+
+    for sym, qty in holdings.items():
+        try:
+            qty = float(qty or 0.0)
+        except (TypeError, ValueError):
+            continue
+
+        if qty > 0:
+            if stored.get(sym) != qty:
+                changed[sym] = qty
+        elif sym in stored:
+            removed.append(sym)
+
+    return changed, removed
+
+
+def write_holdings_diff(client, table, user_id, stored, holdings):
+    changed, removed = diff_holdings(stored, holdings)
+
+    if changed:
+        client.table(table).upsert(
+            [
+                {"user_id": user_id, "symbol": sym, "quantity": qty}
+                for sym, qty in changed.items()
+            ],
+            on_conflict="user_id,symbol",
+        ).execute()
+
+    if removed:
+        (
+            client.table(table)
+            .delete()
+            .eq("user_id", user_id)
+            .in_("symbol", removed)
+            .execute()
+        )
+
+    return changed, removed
+
+
+def _baselines():
+    return st.session_state.setdefault(HOLDINGS_BASELINE_KEY, {})
+
+
+def cached_holdings(table, user_id):
+    """
+    The user's stored {symbol: qty} rows from the local mirror, or None
+    when there is no mirror copy. Never queries Supabase.
+    """
+    mirror = get_mirror()
+
+    if mirror is None:
+        return None
+
+    mirror.remember_token(user_id, st.session_state.get("access_token"))
+
+    return mirror.read(table, user_id)
+
+
+def fetch_stored_holdings(client, table, user_id):
+    """
+    Query the user's {symbol: qty} rows with `client`. Raises on
+    failure and touches no session state, so it is safe to run off the
+    script thread; pass the result to remember_holdings.
+    """
+    res = (
+        client.table(table)
+        .select("symbol,quantity")
+        .eq("user_id", user_id)
+        .execute()
+    )
+
+    return {r["symbol"]: float(r["quantity"] or 0.0) for r in res.data or []}
+
+
+def remember_holdings(table, user_id, stored, symbols, fetched=True):
+    """
+    Keep `stored` as the save baseline (and, when freshly fetched, as
+    the mirror copy) and return it shaped like load_holdings.
+    """
+    mirror = get_mirror()
+
+    if fetched and mirror is not None:
+        mirror.replace(table, user_id, stored)
+
+    _baselines()[(table, user_id)] = stored
+
+    return fill_holdings(stored, symbols)
+
+
+def load_holdings(table, user_id, symbols):
+    """
+    Return {symbol: qty} for every symbol in `symbols` (0.0 when not
+    held) and remember the stored rows as the baseline for saving.
+    """
+    stored = cached_holdings(table, user_id)
+
+    if stored is not None:
+        return remember_holdings(table, user_id, stored, symbols, fetched=False)
+
+    try:
+        stored = fetch_stored_holdings(get_auth_client(), table, user_id)
+    except Exception:
+        return {sym: 0.0 for sym in symbols}
+
+    return remember_holdings(table, user_id, stored, symbols)
+
+
+def save_holdings(table, user_id, holdings):
+    """
+    Persist only what changed since the last load. Returns the number
+    of rows written (upserted + deleted).
+    """
+    baselines = _baselines()
+    key = (table, user_id)
+
+    if key not in baselines:
+        load_holdings(table, user_id, [])
+
+    stored = baselines.get(key, {})
+    mirror = get_mirror()
+
+    if mirror is not None:
+        changed, removed = diff_holdings(stored, holdings)
+        mirror.write(table, user_id, changed, removed)
+    else:
+        changed, removed = write_holdings_diff(
+            get_auth_client(),
+            table,
+            user_id,
+            stored,
+            holdings,
+        )
+
+    stored = dict(stored)
+    stored.update(changed)
+
+    for sym in removed:
+        stored.pop(sym, None)
+
+    baselines[key] = stored
+
+    return len(changed) + len(removed)
+
+
+# -----------------------------------------
+# UNIFIED POSITIONS (ONE ROUND TRIP)
+# get_user_positions (migrations/004) returns
+# all non-zero positions of the signed-in user.
+# -----------------------------------------
+POSITIONS_RPC = "get_user_positions"
+
+# When the function is missing (migration 004 not applied) callers use
+# the per-table loaders, and the RPC is tried again after this long.
+# Other failures (timeouts, network errors) only affect that one call.
+POSITIONS_RPC_RETRY_SECONDS = 600
+MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+
+_positions_rpc = {"missing_since": None}
+
+
+def positions_rpc_available():
+    missing_since = _positions_rpc["missing_since"]
+
+    return (
+        missing_since is None
+        or time.time() - missing_since >= POSITIONS_RPC_RETRY_SECONDS
+    )
+
+
+def use_positions_rpc():
+    """
+    True when holdings should come from load_positions. With a local
+    mirror the per-table loaders are used instead: the mirror answers
+    without a round trip and holds edits not yet synced, which the RPC
+    cannot see.
+    """
+    return get_mirror() is None and positions_rpc_available()
+
+
+def _function_missing(error):
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+
+    return (
+        str(getattr(error, "code", "")) in MISSING_FUNCTION_CODES
+        or str(status) == "404"
+    )
+
+
+def load_positions(client=None):
+    """
+    Return {"crypto": {sym: qty}, "stock": {...}, "etf": {...},
+    "bond": [bond_row, ...]} for the signed-in user, or None when the
+    RPC is unavailable. Bypasses the local mirror; see
+    use_positions_rpc. With an explicit `client` no session state is
+    touched, so it can run off the script thread.
+    """
+    client = client or get_auth_client()
+
+    try:
+        rows = client.rpc(POSITIONS_RPC, {}).execute().data or []
+    except Exception as error:
+        print("Load positions failed:", error)
+
+        if _function_missing(error):
+            _positions_rpc["missing_since"] = time.time()
+
+        return None
+
+    _positions_rpc["missing_since"] = None
+
+    positions = {"crypto": {}, "stock": {}, "etf": {}, "bond": []}
+
+    for row in rows:
+        asset_class = row.get("asset_class")
+
+        if asset_class == "bond":
+            positions["bond"].append(row.get("details") or {})
+
+        elif asset_class in positions:
+            try:
+                positions[asset_class][row["symbol"]] = float(row["quantity"])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+    return positions
+
+
+def fill_holdings(quantities, symbols):
+    """
+    Shape RPC quantities like load_holdings: every catalogue symbol,
+    0.0 when not held, unknown symbols ignored.
+    """
+    holdings = {sym: 0.0 for sym in symbols}
+
+    for sym, qty in quantities.items():
+        if sym in holdings:
+            holdings[sym] = qty
+
+    return holdings
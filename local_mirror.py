@@ -0,0 +1,511 @@
+# local_mirror.py
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from db import create_token_client, get_secret, get_service_client
+
+
+# -----------------------------------------
+# OFFLINE-FIRST LOCAL MIRROR (OPTIONAL)
+# LOCAL_MIRROR=true keeps a SQLite copy of each
+# user's settings, holdings and history. Reads
+# are served locally; writes land locally and
+# in an outbox that a background worker pushes
+# to Supabase. Stale collections are re-pulled
+# in the background.
+# -----------------------------------------
+MIRROR_ENABLED = str(get_secret("LOCAL_MIRROR", "")).lower() in [
+    "true",
+    "1",
+    "yes",
+]
+MIRROR_PATH = get_secret(
+    "LOCAL_MIRROR_PATH",
+    str(Path(__file__).parent / "data" / "local_mirror.sqlite3"),
+)
+
+# Local copies older than this are refreshed in the background.
+MIRROR_PULL_SECONDS = 60
+MIRROR_WORKER_SECONDS = 2.0
+
+# Failed pushes back off exponentially (capped) and are retried until
+# they succeed. Only errors Supabase will never accept (bad request,
+# constraint or permission errors) drop an entry.
+MIRROR_RETRY_MAX_SECONDS = 300
+MIRROR_PERMANENT_STATUSES = {400, 403, 404, 409, 422}
+
+# collection -> (key column, value column, on_conflict)
+COLLECTIONS = {
+    "user_settings": ("key", "value", "user_id,key"),
+    "crypto_holdings": ("symbol", "quantity", "user_id,symbol"),
+    "stock_holdings": ("symbol", "quantity", "user_id,symbol"),
+    "etf_holdings": ("symbol", "quantity", "user_id,symbol"),
+}
+
+SCHEMA = """
+create table if not exists mirror_rows (
+    collection text not null,
+    user_id text not null,
+    key text not null,
+    value real not null,
+    version integer not null default 0,
+    dirty integer not null default 0,
+    deleted integer not null default 0,
+    primary key (collection, user_id, key)
+);
+
+create table if not exists mirror_history (
+    user_id text not null,
+    mode text not null,
+    ts text not null,
+    value real not null,
+    primary key (user_id, mode, ts)
+);
+
+create table if not exists sync_state (
+    collection text not null,
+    user_id text not null,
+    synced_at real not null,
+    primary key (collection, user_id)
+);
+
+create table if not exists outbox (
+    id integer primary key autoincrement,
+    collection text not null,
+    user_id text not null,
+    op text not null,
+    key text not null,
+    value real,
+    version integer not null,
+    attempts integer not null default 0,
+    retry_at real not null default 0
+);
+"""
+
+
+def is_permanent_error(error):
+    """
+    True for errors retrying cannot fix: PostgREST/Postgres rejections
+    carry an SQLSTATE-like code, HTTP client errors a 4xx status.
+    Network failures, timeouts, 401 (expired token), 429 and 5xx are
+    transient.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+
+    if status is not None:
+        try:
+            return int(status) in MIRROR_PERMANENT_STATUSES
+        except (TypeError, ValueError):
+            pass
+
+    code = str(getattr(error, "code", "") or "")
+
+    # Postgres classes 22 (data), 23 (constraint) and 42 (syntax /
+    # permission) are rejections of the row itself.
+    return code[:2] in ["22", "23", "42"]
+
+
+class LocalMirror:
+    """
+    Rows are versioned per (collection, user, key). A local write bumps
+    the version, marks the row dirty and queues an outbox entry; the
+    row is clean again once the entry with that version is pushed. A
+    removal leaves a tombstone row that keeps the key's version until
+    its delete is pushed, so a re-added key continues from there.
+    Pulls replace clean rows only, so unsent local edits always win
+    until they reach the server. Transient push failures are retried
+    with backoff indefinitely; an entry the server rejects is dropped
+    and its key re-pulled so the mirror converges on the server copy.
+
+    Access tokens are never written to disk: the worker pushes a user's
+    entries with the service-role client, or with the last token a
+    session of that user handed over via remember_token().
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._pulls = set()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="local-mirror-sync",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _migrate(self):
+        columns = [row[1] for row in self._conn.execute("pragma table_info(outbox)")]
+
+        if "retry_at" not in columns:
+            self._conn.execute(
+                "alter table outbox add column retry_at real not null default 0"
+            )
+
+        columns = [row[1] for row in self._conn.execute("pragma table_info(mirror_rows)")]
+
+        if "deleted" not in columns:
+            self._conn.execute(
+                "alter table mirror_rows add column deleted integer not null default 0"
+            )
+
+    # ---------- sessions ----------
+    def remember_token(self, user_id, access_token):
+        if user_id and access_token:
+            with self._lock:
+                self._tokens[user_id] = access_token
+
+    def _client(self, user_id):
+        service = get_service_client()
+
+        if service is not None:
+            return service
+
+        with self._lock:
+            token = self._tokens.get(user_id)
+
+        return create_token_client(token) if token else None
+
+    # ---------- key/value collections ----------
+    def read(self, collection, user_id):
+        """
+        Return {key: value} for the user, or None if this collection
+        was never pulled for them. Schedules a refresh when stale.
+        """
+        with self._lock:
+            synced = self._conn.execute(
+                "select synced_at from sync_state where collection = ? and user_id = ?",
+                (collection, user_id),
+            ).fetchone()
+
+            if synced is None:
+                return None
+
+            rows = self._conn.execute(
+                "select key, value from mirror_rows "
+                "where collection = ? and user_id = ? and deleted = 0",
+                (collection, user_id),
+            ).fetchall()
+
+        if time.time() - synced[0] >= MIRROR_PULL_SECONDS:
+            self.request_pull(collection, user_id)
+
+        return {key: value for key, value in rows}
+
+    def replace(self, collection, user_id, values):
+        """
+        Store a fresh server copy. Dirty rows and keys with unsent
+        outbox entries (including deletes) keep their local state.
+        """
+        with self._lock:
+            pending = {
+                key
+                for (key,) in self._conn.execute(
+                    "select key from outbox where collection = ? and user_id = ?",
+                    (collection, user_id),
+                )
+            }
+
+            self._conn.execute(
+                "delete from mirror_rows where collection = ? and user_id = ? and dirty = 0",
+                (collection, user_id),
+            )
+            self._conn.executemany(
+                "insert or ignore into mirror_rows (collection, user_id, key, value) "
+                "values (?, ?, ?, ?)",
+                [
+                    (collection, user_id, key, float(v))
+                    for key, v in values.items()
+                    if key not in pending
+                ],
+            )
+            self._conn.execute(
+                "insert or replace into sync_state values (?, ?, ?)",
+                (collection, user_id, time.time()),
+            )
+            self._conn.commit()
+
+    def write(self, collection, user_id, changed, removed=()):
+        """
+        Apply changes locally and queue them for Supabase.
+        """
+        with self._lock:
+            for key, value in changed.items():
+                version = self._bump(collection, user_id, key, float(value))
+                self._queue(collection, user_id, "upsert", key, float(value), version)
+
+            for key in removed:
+                version = self._bump(collection, user_id, key, 0.0, deleted=True)
+                self._queue(collection, user_id, "delete", key, None, version)
+
+            self._conn.commit()
+
+        self._wake.set()
+
+    def _bump(self, collection, user_id, key, value, deleted=False):
+        # Tombstones are found here too, so versions never go back.
+        row = self._conn.execute(
+            "select version from mirror_rows where collection = ? and user_id = ? and key = ?",
+            (collection, user_id, key),
+        ).fetchone()
+        version = (row[0] if row else 0) + 1
+
+        self._conn.execute(
+            "insert or replace into mirror_rows "
+            "(collection, user_id, key, value, version, dirty, deleted) "
+            "values (?, ?, ?, ?, ?, 1, ?)",
+            (collection, user_id, key, value, version, int(deleted)),
+        )
+
+        return version
+
+    def _queue(self, collection, user_id, op, key, value, version):
+        self._conn.execute(
+            "insert into outbox (collection, user_id, op, key, value, version) "
+            "values (?, ?, ?, ?, ?, ?)",
+            (collection, user_id, op, key, value, version),
+        )
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("select count(*) from outbox").fetchone()[0]
+
+    # ---------- history ----------
+    def history(self, user_id, mode, since=None):
+        with self._lock:
+            rows = self._conn.execute(
+                "select ts, value from mirror_history "
+                "where user_id = ? and mode = ? order by ts",
+                (user_id, mode),
+            ).fetchall()
+
+        frame = pd.DataFrame(rows, columns=["timestamp", "value_ghs"])
+        frame["timestamp"] = pd.to_datetime(frame["timestamp"], errors="coerce")
+        frame = frame.dropna().sort_values("timestamp")
+
+        if since is not None and not frame.empty:
+            since = pd.Timestamp(since)
+
+            if frame["timestamp"].dt.tz is not None and since.tz is None:
+                since = since.tz_localize("UTC")
+
+            frame = frame[frame["timestamp"] >= since]
+
+        return frame.reset_index(drop=True)
+
+    def store_history(self, user_id, mode, frame, replace=False):
+        rows = [
+            (user_id, mode, ts.isoformat(), float(value))
+            for ts, value in zip(frame["timestamp"], frame["value_ghs"])
+        ]
+
+        with self._lock:
+            if replace:
+                self._conn.execute(
+                    "delete from mirror_history where user_id = ? and mode = ?",
+                    (user_id, mode),
+                )
+
+            self._conn.executemany(
+                "insert or replace into mirror_history values (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    # ---------- background sync ----------
+    def request_pull(self, collection, user_id):
+        with self._lock:
+            self._pulls.add((collection, user_id))
+
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(MIRROR_WORKER_SECONDS)
+            self._wake.clear()
+
+            try:
+                self._push()
+                self._pull_requested()
+            except Exception as error:
+                print("Local mirror sync failed:", error)
+
+    def _push(self):
+        now = time.time()
+
+        with self._lock:
+            entries = self._conn.execute(
+                "select id, collection, user_id, op, key, value, version, attempts, retry_at "
+                "from outbox order by id limit 200"
+            ).fetchall()
+
+        blocked = set()
+
+        for (
+            entry_id, collection, user_id, op, key, value, version, attempts, retry_at
+        ) in entries:
+            # Keep each user's writes in order: stop at their first
+            # entry that is backing off or fails.
+            if user_id in blocked:
+                continue
+
+            if retry_at > now:
+                blocked.add(user_id)
+                continue
+
+            client = self._client(user_id)
+
+            if client is None:
+                blocked.add(user_id)
+                continue
+
+            key_col, value_col, on_conflict = COLLECTIONS[collection]
+
+            try:
+                if op == "upsert":
+                    client.table(collection).upsert(
+                        {"user_id": user_id, key_col: key, value_col: value},
+                        on_conflict=on_conflict,
+                    ).execute()
+                else:
+                    (
+                        client.table(collection)
+                        .delete()
+                        .eq("user_id", user_id)
+                        .eq(key_col, key)
+                        .execute()
+                    )
+
+            except Exception as error:
+                if is_permanent_error(error):
+                    print(f"Mirror push to {collection} rejected, dropping:", error)
+                    self._drop(entry_id, collection, user_id, key)
+                    continue
+
+                print(f"Mirror push to {collection} failed:", error)
+                blocked.add(user_id)
+                delay = min(MIRROR_RETRY_MAX_SECONDS, MIRROR_WORKER_SECONDS * 2 ** attempts)
+
+                with self._lock:
+                    self._conn.execute(
+                        "update outbox set attempts = attempts + 1, retry_at = ? where id = ?",
+                        (time.time() + delay, entry_id),
+                    )
+                    self._conn.commit()
+                continue
+
+            with self._lock:
+                self._conn.execute("delete from outbox where id = ?", (entry_id,))
+
+                if op == "delete":
+                    # Only the tombstone this delete wrote; a key
+                    # re-added since then has a higher version.
+                    self._conn.execute(
+                        "delete from mirror_rows "
+                        "where collection = ? and user_id = ? and key = ? "
+                        "and deleted = 1 and version <= ?",
+                        (collection, user_id, key, version),
+                    )
+
+                self._conn.execute(
+                    "update mirror_rows set dirty = 0 "
+                    "where collection = ? and user_id = ? and key = ? and version <= ?",
+                    (collection, user_id, key, version),
+                )
+                self._conn.commit()
+
+    def _drop(self, entry_id, collection, user_id, key):
+        """
+        Give up on an entry the server rejected: clear the key's local
+        edit so the next pull restores the server's value.
+        """
+        with self._lock:
+            self._conn.execute("delete from outbox where id = ?", (entry_id,))
+
+            remaining = self._conn.execute(
+                "select 1 from outbox where collection = ? and user_id = ? and key = ?",
+                (collection, user_id, key),
+            ).fetchone()
+
+            if remaining is None:
+                self._conn.execute(
+                    "delete from mirror_rows "
+                    "where collection = ? and user_id = ? and key = ? and deleted = 1",
+                    (collection, user_id, key),
+                )
+                self._conn.execute(
+                    "update mirror_rows set dirty = 0 "
+                    "where collection = ? and user_id = ? and key = ?",
+                    (collection, user_id, key),
+                )
+
+            self._conn.commit()
+
+        self.request_pull(collection, user_id)
+
+    def _pull_requested(self):
+        with self._lock:
+            pulls = list(self._pulls)
+            self._pulls.clear()
+
+        for collection, user_id in pulls:
+            client = self._client(user_id)
+
+            if client is None:
+                continue
+
+            key_col, value_col, _ = COLLECTIONS[collection]
+
+            try:
+                res = (
+                    client.table(collection)
+                    .select(f"{key_col},{value_col}")
+                    .eq("user_id", user_id)
+                    .execute()
+                )
+            except Exception as error:
+                print(f"Mirror pull of {collection} failed:", error)
+                continue
+
+            values = {}
+
+            for row in res.data or []:
+                try:
+                    values[row[key_col]] = float(row[value_col])
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+            self.replace(collection, user_id, values)
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """
+    The process-wide mirror, or None when LOCAL_MIRROR is off.
+    """
+    global _mirror
+
+    if not MIRROR_ENABLED:
+        return None
+
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = LocalMirror(MIRROR_PATH)
+
+    return _mirror
@@ -0,0 +1,417 @@
+# market_data.py
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+
+ASSET_CLASSES = ("crypto", "stocks")
+
+# Upper bound for one upstream source inside a refresh cycle.
+DEFAULT_SOURCE_TIMEOUT = 15
+
+
+# -----------------------------------------
+# IMMUTABLE PRICE SNAPSHOT
+# Sessions only ever hold a reference to one
+# of these; the refresher publishes a new one
+# instead of mutating the old.
+# -----------------------------------------
+Quote = namedtuple("Quote", ["price", "fetched_at", "provider"])
+
+PriceSnapshot = namedtuple(
+    "PriceSnapshot",
+    ["version", "updated_at", "crypto", "stocks", "feeds"],
+)
+
+EMPTY_SNAPSHOT = PriceSnapshot(
+    version=0,
+    updated_at=0.0,
+    crypto=MappingProxyType({}),
+    stocks=MappingProxyType({}),
+    feeds=MappingProxyType({}),
+)
+
+
+def merge_quotes(previous, fresh, fetched_at, provider=None):
+    """
+    Overlay freshly fetched prices on the previous snapshot.
+    Missing or non-positive quotes keep their last good value
+    (and its older timestamp), so they show up as stale.
+
+    Values may be plain prices or (price, provider) pairs from a
+    provider chain.
+    """
+    merged = dict(previous)
+
+    for symbol, value in fresh.items():
+        source = provider
+
+        if isinstance(value, tuple):
+            value, source = value
+
+        try:
+            price = float(value or 0.0)
+        except (TypeError, ValueError):
+            continue
+
+        if price > 0:
+            merged[symbol] = Quote(price, fetched_at, source)
+
+    return MappingProxyType(merged)
+
+
+# -----------------------------------------
+# LAST-KNOWN-GOOD PRICE FILE
+# Lets a restarted worker serve the previous
+# prices immediately instead of an empty page.
+# -----------------------------------------
+class LastKnownGoodStore:
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def load(self):
+        quotes = {name: {} for name in ASSET_CLASSES}
+
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return quotes
+
+        for name in ASSET_CLASSES:
+            for symbol, entry in (data.get(name) or {}).items():
+                try:
+                    price, fetched_at = float(entry[0]), float(entry[1])
+                except (TypeError, ValueError, IndexError):
+                    continue
+
+                provider = entry[2] if len(entry) > 2 else None
+
+                if price > 0:
+                    quotes[name][symbol] = Quote(price, fetched_at, provider)
+
+        return quotes
+
+    def save(self, snapshot):
+        data = {
+            name: {
+                symbol: [quote.price, quote.fetched_at, quote.provider]
+                for symbol, quote in getattr(snapshot, name).items()
+            }
+            for name in ASSET_CLASSES
+        }
+
+        tmp_path = self.path + ".tmp"
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+
+            os.replace(tmp_path, self.path)
+
+        except OSError as error:
+            print("Price cache write failed:", error)
+
+
+# -----------------------------------------
+# PROCESS-WIDE MARKET DATA SERVICE
+# -----------------------------------------
+class MarketDataService:
+    """
+    One background thread refreshes crypto and stock prices on a
+    schedule and publishes a versioned snapshot. Dashboard renders
+    read the snapshot and never wait on a network call.
+
+    The snapshot is a stale-while-revalidate cache: every symbol keeps
+    its own fetch time, reads always get the last good price, and only
+    symbols older than their asset-class interval are fetched again.
+
+    All sources due in a cycle (crypto, stocks and registered feeds
+    such as news) are fetched concurrently with per-source timeouts,
+    so a cycle costs the slowest source rather than the sum.
+    """
+
+    def __init__(
+        self,
+        fetch_crypto,
+        fetch_stocks,
+        crypto_interval=300,
+        stock_interval=300,
+        demand_ttl=1800,
+        coalesce_window=0.5,
+        store=None,
+        timeouts=None,
+    ):
+        self._fetchers = {
+            "crypto": fetch_crypto,
+            "stocks": fetch_stocks,
+        }
+        self._intervals = {
+            "crypto": crypto_interval,
+            "stocks": stock_interval,
+        }
+        self._next_due = {name: 0.0 for name in ASSET_CLASSES}
+        self._timeouts = dict(timeouts or {})
+        self._feeds = {}
+
+        # symbol -> last time any session asked for it
+        self._demand = {name: {} for name in ASSET_CLASSES}
+        self._demand_ttl = demand_ttl
+        self._coalesce_window = coalesce_window
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+        # Sources fetched at least once (see wait_for_first_fetch).
+        self._attempted = set()
+        self._fetched = threading.Condition()
+
+        self._store = store
+        self._snapshot = self._initial_snapshot()
+        self._thread = None
+
+        # Owned pool: timed-out fetches must not block asyncio.run()
+        # from returning while it shuts down the default executor.
+        self._executor = ThreadPoolExecutor(
+            max_workers=4,
+            thread_name_prefix="market-data-fetch",
+        )
+
+    def _initial_snapshot(self):
+        if self._store is None:
+            return EMPTY_SNAPSHOT
+
+        quotes = self._store.load()
+
+        return EMPTY_SNAPSHOT._replace(
+            crypto=MappingProxyType(quotes["crypto"]),
+            stocks=MappingProxyType(quotes["stocks"]),
+        )
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+
+            self._thread = threading.Thread(
+                target=self._run,
+                name="market-data-refresher",
+                daemon=True,
+            )
+            self._thread.start()
+
+        return self
+
+    def snapshot(self):
+        return self._snapshot
+
+    def register_feed(self, name, fetcher, interval, timeout=None):
+        """
+        Add a symbol-less source (e.g. market news) that is refreshed
+        alongside prices and published under `snapshot().feeds[name]`.
+        Registering the same name again is a no-op.
+        """
+        with self._lock:
+            if name in self._feeds:
+                return
+
+            self._feeds[name] = fetcher
+            self._intervals[name] = interval
+            self._next_due[name] = 0.0
+
+            if timeout is not None:
+                self._timeouts[name] = timeout
+
+        self._wake.set()
+
+    def watch(self, asset_class, symbols):
+        """
+        Register symbols a session currently holds. The refresher only
+        fetches the union of symbols watched within `demand_ttl`, and
+        unseen symbols wake it so they appear in the next snapshot.
+        """
+        now = time.time()
+
+        with self._lock:
+            demand = self._demand[asset_class]
+            new_symbols = [sym for sym in symbols if sym not in demand]
+
+            for sym in symbols:
+                demand[sym] = now
+
+            if new_symbols:
+                self._next_due[asset_class] = 0.0
+
+        if new_symbols:
+            self._wake.set()
+
+    def watched_symbols(self, asset_class):
+        cutoff = time.time() - self._demand_ttl
+
+        with self._lock:
+            demand = self._demand[asset_class]
+
+            for sym in [s for s, seen in demand.items() if seen < cutoff]:
+                del demand[sym]
+
+            return sorted(demand)
+
+    def stale_symbols(self, asset_class, symbols, now=None, max_age=None):
+        now = time.time() if now is None else now
+        quotes = getattr(self._snapshot, asset_class)
+
+        if max_age is None:
+            max_age = self._intervals[asset_class]
+
+        return [
+            sym
+            for sym in symbols
+            if sym not in quotes or now - quotes[sym].fetched_at >= max_age
+        ]
+
+    def refresh(self, force=False):
+        now = time.time()
+
+        with self._lock:
+            due = [
+                name
+                for name, at in self._next_due.items()
+                if force or at <= now
+            ]
+
+            for name in due:
+                self._next_due[name] = now + self._intervals[name]
+
+        if not due:
+            return self._snapshot
+
+        current = self._snapshot
+        quotes = {name: getattr(current, name) for name in ASSET_CLASSES}
+        feeds = dict(current.feeds)
+        jobs = {}
+
+        for name in due:
+            if name in self._feeds:
+                jobs[name] = (self._feeds[name], ())
+                continue
+
+            watched = self.watched_symbols(name)
+
+            if force:
+                symbols = watched
+            else:
+                # Half an interval of slack so quotes fetched just after
+                # the previous run are not skipped for a whole cycle.
+                symbols = self.stale_symbols(
+                    name,
+                    watched,
+                    now,
+                    max_age=self._intervals[name] / 2,
+                )
+
+            if symbols:
+                jobs[name] = (self._fetchers[name], (symbols,))
+
+        if not jobs:
+            return current
+
+        results = asyncio.run(self._fetch_all(jobs))
+        fetched_at = time.time()
+        changed = False
+
+        for name, fresh in results.items():
+            if not fresh:
+                continue
+
+            if name in self._feeds:
+                feeds[name] = fresh
+            else:
+                quotes[name] = merge_quotes(
+                    quotes[name],
+                    fresh,
+                    fetched_at,
+                    provider=getattr(self._fetchers[name], "name", None),
+                )
+
+            changed = True
+
+        if changed:
+            self._snapshot = PriceSnapshot(
+                version=current.version + 1,
+                updated_at=time.time(),
+                crypto=quotes["crypto"],
+                stocks=quotes["stocks"],
+                feeds=MappingProxyType(feeds),
+            )
+
+            if self._store is not None:
+                self._store.save(self._snapshot)
+
+        with self._fetched:
+            self._attempted.update(results)
+            self._fetched.notify_all()
+
+        return self._snapshot
+
+    def wait_for_first_fetch(self, name, timeout):
+        """
+        Block (at most `timeout` seconds) until `name` has been fetched
+        once in this process, successfully or not. Lets the very first
+        render of a cold process show data instead of empty values;
+        returns at once afterwards.
+        """
+        with self._fetched:
+            return self._fetched.wait_for(
+                lambda: name in self._attempted,
+                timeout,
+            )
+
+    async def _fetch_all(self, jobs):
+        names = list(jobs)
+        results = await asyncio.gather(
+            *(self._fetch_one(name, *jobs[name]) for name in names)
+        )
+
+        return dict(zip(names, results))
+
+    async def _fetch_one(self, name, fetcher, args):
+        loop = asyncio.get_running_loop()
+        timeout = self._timeouts.get(name, DEFAULT_SOURCE_TIMEOUT)
+
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, fetcher, *args),
+                timeout,
+            )
+
+        except asyncio.TimeoutError:
+            print(f"Market data source '{name}' timed out after {timeout}s")
+
+        except Exception as error:
+            print(f"Market data source '{name}' failed:", error)
+
+        return None
+
+    def _seconds_until_due(self):
+        with self._lock:
+            next_due = min(self._next_due.values())
+
+        return max(1.0, next_due - time.time())
+
+    def _run(self):
+        while True:
+            self.refresh()
+
+            if self._wake.wait(self._seconds_until_due()):
+                # Let other sessions' new symbols join the same batch.
+                time.sleep(self._coalesce_window)
+
+            self._wake.clear()
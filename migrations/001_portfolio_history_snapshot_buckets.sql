@@ -0,0 +1,13 @@
+-- Autosaves write one row per (user, mode, time bucket) and upsert on
+-- conflict, so portfolio_history needs a unique key on those columns.
+
+-- Drop exact duplicates first so the index can be built.
+delete from public.portfolio_history a
+using public.portfolio_history b
+where a.user_id = b.user_id
+  and a.mode = b.mode
+  and a."timestamp" = b."timestamp"
+  and a.ctid < b.ctid;
+
+create unique index if not exists portfolio_history_user_mode_timestamp_key
+    on public.portfolio_history (user_id, mode, "timestamp");
@@ -0,0 +1,102 @@
+-- Hourly, daily and weekly open/high/low/close of portfolio_history per
+-- user and mode. Kept up to date by a trigger as snapshots arrive, so
+-- long-range charts read a few hundred rollup rows instead of every
+-- raw snapshot. Rollups are not touched when raw rows are deleted
+-- (e.g. by compaction), so thinned periods keep their shape.
+
+create table if not exists public.portfolio_history_rollup (
+    user_id uuid not null,
+    mode text not null,
+    resolution text not null check (resolution in ('hour', 'day', 'week')),
+    bucket timestamptz not null,
+    open numeric not null,
+    high numeric not null,
+    low numeric not null,
+    close numeric not null,
+    first_at timestamptz not null,
+    last_at timestamptz not null,
+    samples integer not null default 1,
+    primary key (user_id, mode, resolution, bucket)
+);
+
+alter table public.portfolio_history_rollup enable row level security;
+
+drop policy if exists "Users read own rollups" on public.portfolio_history_rollup;
+
+create policy "Users read own rollups"
+    on public.portfolio_history_rollup
+    for select
+    using (auth.uid() = user_id);
+
+
+-- Updates of an existing snapshot (autosave bucket upserts) move
+-- open/close; high/low only ever widen.
+create or replace function public.rollup_portfolio_snapshot()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    res text;
+begin
+    foreach res in array array['hour', 'day', 'week'] loop
+        insert into public.portfolio_history_rollup as r (
+            user_id, mode, resolution, bucket,
+            open, high, low, close, first_at, last_at
+        )
+        values (
+            new.user_id, new.mode, res, date_trunc(res, new."timestamp"),
+            new.value_ghs, new.value_ghs, new.value_ghs, new.value_ghs,
+            new."timestamp", new."timestamp"
+        )
+        on conflict (user_id, mode, resolution, bucket) do update set
+            open = case
+                when excluded.first_at <= r.first_at then excluded.open
+                else r.open
+            end,
+            first_at = least(r.first_at, excluded.first_at),
+            high = greatest(r.high, excluded.high),
+            low = least(r.low, excluded.low),
+            close = case
+                when excluded.last_at >= r.last_at then excluded.close
+                else r.close
+            end,
+            last_at = greatest(r.last_at, excluded.last_at),
+            samples = r.samples + case when tg_op = 'INSERT' then 1 else 0 end;
+    end loop;
+
+    return new;
+end;
+$$;
+
+drop trigger if exists portfolio_history_rollup_trg on public.portfolio_history;
+
+create trigger portfolio_history_rollup_trg
+    after insert or update of value_ghs, "timestamp"
+    on public.portfolio_history
+    for each row
+    execute function public.rollup_portfolio_snapshot();
+
+
+-- Backfill from existing snapshots.
+insert into public.portfolio_history_rollup (
+    user_id, mode, resolution, bucket,
+    open, high, low, close, first_at, last_at, samples
+)
+select
+    h.user_id,
+    h.mode,
+    res.name,
+    date_trunc(res.name, h."timestamp"),
+    (array_agg(h.value_ghs order by h."timestamp"))[1],
+    max(h.value_ghs),
+    min(h.value_ghs),
+    (array_agg(h.value_ghs order by h."timestamp" desc))[1],
+    min(h."timestamp"),
+    max(h."timestamp"),
+    count(*)
+from public.portfolio_history h
+cross join (values ('hour'), ('day'), ('week')) as res(name)
+group by h.user_id, h.mode, res.name, date_trunc(res.name, h."timestamp")
+on conflict (user_id, mode, resolution, bucket) do nothing;
@@ -0,0 +1,75 @@
+-- Thins old portfolio_history rows; called by compact_history.py.
+--
+--   newer than raw_before            -> untouched
+--   raw_before .. hourly_before      -> last row of each hour
+--   older than hourly_before         -> last row of each day
+--
+-- The first row of every month is always kept, so MTD and YTD baselines
+-- do not move. Rollups (migrations/002) are not affected by deletes.
+-- Returns the number of rows removed and their on-disk size; the space
+-- becomes reusable after the next (auto)vacuum.
+
+create or replace function public.compact_portfolio_history(
+    raw_before timestamptz,
+    hourly_before timestamptz,
+    dry_run boolean default false
+)
+returns table (rows_removed bigint, bytes_reclaimed bigint)
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    return query
+    with ranked as (
+        select
+            h.id,
+            pg_column_size(h.*) as row_bytes,
+            row_number() over (
+                partition by
+                    h.user_id,
+                    h.mode,
+                    case
+                        when h."timestamp" < hourly_before
+                            then date_trunc('day', h."timestamp")
+                        else date_trunc('hour', h."timestamp")
+                    end
+                order by h."timestamp" desc, h.id desc
+            ) as keep_rank,
+            row_number() over (
+                partition by h.user_id, h.mode, date_trunc('month', h."timestamp")
+                order by h."timestamp", h.id
+            ) as month_rank
+        from public.portfolio_history h
+        where h."timestamp" < raw_before
+    ),
+    doomed as (
+        select r.id, r.row_bytes
+        from ranked r
+        where r.keep_rank > 1
+          and r.month_rank > 1
+    ),
+    deleted as (
+        delete from public.portfolio_history h
+        using doomed d
+        where h.id = d.id
+          and not dry_run
+        returning h.id
+    )
+    select
+        count(*)::bigint,
+        coalesce(sum(d.row_bytes), 0)::bigint
+    from doomed d;
+end;
+$$;
+
+revoke execute on function public.compact_portfolio_history(timestamptz, timestamptz, boolean)
+    from public, anon, authenticated;
+
+-- Optional nightly run inside the database instead of the CLI:
+-- select cron.schedule(
+--     'compact-portfolio-history',
+--     '30 3 * * *',
+--     $$select * from public.compact_portfolio_history(
+--         now() - interval '7 days', now() - interval '90 days')$$
+-- );
@@ -0,0 +1,56 @@
+-- Every position of the calling user across the four holdings tables in
+-- one round trip, with one normalized row shape:
+--
+--   asset_class  'crypto' | 'stock' | 'etf' | 'bond'
+--   symbol       ticker, or the bond's name
+--   quantity     units held (1 for a bond)
+--   details      full bond row as JSON (null for other classes)
+--   position     bonds: order of creation; 0 otherwise
+--
+-- Zero-quantity rows are left out. Runs as the caller, so RLS applies.
+
+create or replace function public.get_user_positions()
+returns table (
+    asset_class text,
+    symbol text,
+    quantity numeric,
+    details jsonb,
+    position bigint
+)
+language sql
+stable
+security invoker
+set search_path = public
+as $$
+    select 'crypto', c.symbol, c.quantity::numeric, null::jsonb, 0::bigint
+    from crypto_holdings c
+    where c.user_id = auth.uid() and c.quantity > 0
+
+    union all
+
+    select 'stock', s.symbol, s.quantity::numeric, null::jsonb, 0::bigint
+    from stock_holdings s
+    where s.user_id = auth.uid() and s.quantity > 0
+
+    union all
+
+    select 'etf', e.symbol, e.quantity::numeric, null::jsonb, 0::bigint
+    from etf_holdings e
+    where e.user_id = auth.uid() and e.quantity > 0
+
+    union all
+
+    select
+        'bond',
+        b.name,
+        1::numeric,
+        to_jsonb(b) - 'user_id',
+        row_number() over (order by b.created_at)
+    from bond_holdings b
+    where b.user_id = auth.uid()
+
+    order by 1, 5, 2;
+$$;
+
+revoke execute on function public.get_user_positions() from public, anon;
+grant execute on function public.get_user_positions() to authenticated;
@@ -1,17 +1,43 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 
-from db import get_supabase
+from auth import get_auth_client
+from history_store import (
+    cache_chart_history,
+    cached_chart_history,
+    fetch_chart_rollup,
+    fetch_history,
+    plan_history,
+    session_history,
+    store_history,
+)
+from holdings_store import (
+    cached_holdings,
+    fetch_stored_holdings,
+    fill_holdings,
+    load_positions,
+    remember_holdings,
+    use_positions_rpc,
+)
+from settings_store import (
+    SettingsUnavailable,
+    cached_settings,
+    fetch_settings,
+    save_setting,
+    store_settings,
+)
 from portfolio_tracker import autosave_portfolio_value, manual_snapshot
-from price_history import crypto_live_prices, stock_live_prices
+from price_history import crypto_live_prices, held_symbols, stock_live_prices
 
-from crypto_mode import API_MAP, load_crypto_holdings
-from stock_mode import STOCK_MAP, load_stock_holdings
-from etf_mode import ETF_MAP, load_etf_holdings
-from bond_mode import load_bond_holdings
+from crypto_mode import API_MAP
+from stock_mode import STOCK_MAP
+from etf_mode import ETF_MAP
+from bond_mode import fetch_bond_holdings
 
 
 CURRENCY_OPTIONS = [
@@ -49,44 +75,6 @@ DONUT_CONFIG = {
 }
 
 
-def db():
-    supabase = get_supabase()
-
-    if "access_token" in st.session_state:
-        try:
-            supabase.auth.set_session(
-                access_token=st.session_state.access_token,
-                refresh_token=st.session_state.refresh_token,
-            )
-        except Exception:
-            pass
-
-    return supabase
-
-
-def load_setting(user_id, key, default):
-    try:
-        res = (
-            db()
-            .table("user_settings")
-            .select("value")
-            .eq("user_id", user_id)
-            .eq("key", key)
-            .single()
-            .execute()
-        )
-        return float(res.data["value"])
-    except Exception:
-        return default
-
-
-def save_setting(user_id, key, value):
-    db().table("user_settings").upsert(
-        {"user_id": user_id, "key": key, "value": float(value)},
-        on_conflict="user_id,key",
-    ).execute()
-
-
 def currency_label(currency):
     return f'{currency["code"]} - {currency["name"]}'
 
@@ -120,35 +108,6 @@ def to_master(value, source_usd_rate, master_usd_rate):
     return (value / source_rate) * master_rate
 
 
-def load_overview_history(user_id):
-    try:
-        res = (
-            db()
-            .table("portfolio_history")
-            .select("timestamp,value_ghs")
-            .eq("user_id", user_id)
-            .eq("mode", "overview")
-            .order("timestamp")
-            .execute()
-        )
-        return res.data or []
-    except Exception:
-        return []
-
-
-def clean_history(history):
-    if not history:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(history)
-    if df.empty:
-        return df
-
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    df["value_ghs"] = pd.to_numeric(df["value_ghs"], errors="coerce")
-    return df.dropna().sort_values("timestamp")
-
-
 def safe_price(memory_key, symbol, raw_price):
     if memory_key not in st.session_state:
         st.session_state[memory_key] = {}
@@ -171,25 +130,238 @@ def safe_price(memory_key, symbol, raw_price):
     return None, False
 
 
-def get_market_prices():
+def get_market_prices(crypto_holdings, stock_holdings, etf_holdings):
     try:
-        crypto_prices = crypto_live_prices() or {}
+        crypto_prices = crypto_live_prices(held_symbols(crypto_holdings)) or {}
     except Exception:
         crypto_prices = {}
 
-    try:
-        stock_prices = stock_live_prices(list(STOCK_MAP.keys())) or {}
-    except Exception:
-        stock_prices = {}
+    # Stocks and ETFs share one batched quote request; the result is
+    # fanned back out to each asset class.
+    stock_symbols = held_symbols(stock_holdings)
+    etf_symbols = held_symbols(etf_holdings)
 
     try:
-        etf_prices = stock_live_prices(list(ETF_MAP.keys())) or {}
+        equity_prices = stock_live_prices(stock_symbols + etf_symbols) or {}
     except Exception:
-        etf_prices = {}
+        equity_prices = {}
+
+    stock_prices = {
+        sym: equity_prices[sym]
+        for sym in stock_symbols
+        if sym in equity_prices
+    }
+    etf_prices = {
+        sym: equity_prices[sym]
+        for sym in etf_symbols
+        if sym in equity_prices
+    }
 
     return crypto_prices, stock_prices, etf_prices
 
 
+# -----------------------------------------
+# PARALLEL OVERVIEW LOADING
+# Settings, holdings and the chart history are
+# independent round trips; they run together
+# on a shared, bounded pool. Pooled tasks only
+# query and return values: caches, baselines and
+# the mirror are updated on the script thread,
+# so a task that outlives the deadline changes
+# nothing.
+# -----------------------------------------
+OVERVIEW_LOAD_WORKERS = 8
+
+# Sources still running at the deadline fall back to empty data.
+OVERVIEW_LOAD_DEADLINE = 10.0
+
+HOLDINGS_TABLES = {
+    "crypto": ("crypto_holdings", API_MAP),
+    "stock": ("stock_holdings", STOCK_MAP),
+    "etf": ("etf_holdings", ETF_MAP),
+}
+
+_overview_pool = ThreadPoolExecutor(
+    max_workers=OVERVIEW_LOAD_WORKERS,
+    thread_name_prefix="overview-load",
+)
+
+
+def _run_pooled(tasks, timeout):
+    """
+    Run {name: (fn, args)} on the pool. Returns (values, failed): the
+    values of the tasks that finished, and the names of those that
+    raised or were still running after `timeout` seconds.
+    """
+    futures = {
+        name: _overview_pool.submit(fn, *args)
+        for name, (fn, args) in tasks.items()
+    }
+
+    wait(list(futures.values()), timeout=timeout)
+
+    values = {}
+    failed = []
+
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            failed.append(name)
+            continue
+
+        try:
+            values[name] = future.result()
+        except Exception as error:
+            print(f"Overview source '{name}' failed:", error)
+            failed.append(name)
+
+    return values, failed
+
+
+def _fetch_overview_history(client, user_id, chart_cached, plan):
+    """
+    Pooled: (rollup frame or None, raw history rows or None). Raw rows
+    are only fetched when the chart falls back to them and plan_history
+    asked for a sync.
+    """
+    chart = None
+
+    if not chart_cached:
+        chart = fetch_chart_rollup(client, user_id, "overview")
+
+    if chart is not None or plan is None:
+        return chart, None
+
+    return chart, fetch_history(user_id, "overview", plan[1], client=client)
+
+
+def _holdings_tasks(client, user_id, results):
+    """
+    Per-table holdings tasks; tables the mirror already holds are
+    filled into `results` directly.
+    """
+    tasks = {"bond": (fetch_bond_holdings, (client, user_id))}
+
+    for name, (table, symbols) in HOLDINGS_TABLES.items():
+        stored = cached_holdings(table, user_id)
+
+        if stored is None:
+            tasks[name] = (fetch_stored_holdings, (client, table, user_id))
+        else:
+            results[name] = remember_holdings(
+                table, user_id, stored, symbols, fetched=False
+            )
+
+    return tasks
+
+
+def _apply_holdings(user_id, values, results):
+    for name, (table, symbols) in HOLDINGS_TABLES.items():
+        if name in results:
+            continue
+
+        if name in values:
+            results[name] = remember_holdings(table, user_id, values[name], symbols)
+        else:
+            results[name] = fill_holdings({}, symbols)
+
+    results["bond"] = values.get("bond", [])
+
+
+def load_overview_data(user_id, deadline=OVERVIEW_LOAD_DEADLINE):
+    """
+    Returns (results, timed_out). Sources that failed to finish before
+    the deadline get their fallback value and are named in timed_out.
+    """
+    started = time.monotonic()
+
+    # Attach/refresh the auth session once, before threads share it.
+    client = get_auth_client()
+
+    results = {}
+    unavailable = []
+    tasks = {}
+
+    try:
+        results["settings"] = cached_settings(user_id, raise_errors=True)
+    except SettingsUnavailable:
+        results["settings"] = {}
+        unavailable.append("settings")
+
+    if results["settings"] is None:
+        tasks["settings"] = (fetch_settings, (client, user_id))
+
+    chart_cached, chart = cached_chart_history(user_id, "overview")
+    plan = None if chart is not None else plan_history(user_id, "overview")
+
+    if not chart_cached or plan is not None:
+        tasks["history"] = (
+            _fetch_overview_history,
+            (client, user_id, chart_cached, plan),
+        )
+
+    use_rpc = use_positions_rpc()
+
+    if use_rpc:
+        # All four holdings tables in one round trip.
+        tasks["positions"] = (load_positions, (client,))
+    else:
+        tasks.update(_holdings_tasks(client, user_id, results))
+
+    values, failed = _run_pooled(tasks, deadline)
+
+    if "settings" in tasks:
+        if "settings" in values:
+            results["settings"] = values["settings"]
+            store_settings(user_id, values["settings"])
+        else:
+            results["settings"] = {}
+            store_settings(user_id, {}, failed=True)
+
+    if "history" in values:
+        chart, fetched = values["history"]
+
+        if not chart_cached:
+            cache_chart_history(user_id, "overview", chart)
+
+        if fetched is not None:
+            store_history(user_id, "overview", plan[0], fetched)
+
+    results["history"] = (
+        chart if chart is not None else session_history(user_id, "overview")
+    )
+
+    if use_rpc:
+        positions = values.get("positions")
+
+        if positions is None and "positions" not in failed:
+            # RPC missing: read the tables directly this once, still
+            # within what is left of the deadline.
+            remaining = max(0.0, deadline - (time.monotonic() - started))
+            table_values, table_failed = _run_pooled(
+                _holdings_tasks(client, user_id, results),
+                remaining,
+            )
+            failed.extend(table_failed)
+            _apply_holdings(user_id, table_values, results)
+
+        elif positions is None:
+            failed.remove("positions")
+            failed.extend(["crypto", "stock", "etf", "bond"])
+            _apply_holdings(user_id, {}, results)
+
+        else:
+            for name, (_, symbols) in HOLDINGS_TABLES.items():
+                results[name] = fill_holdings(positions[name], symbols)
+
+            results["bond"] = positions["bond"]
+
+    else:
+        _apply_holdings(user_id, values, results)
+
+    return results, unavailable + failed
+
+
 def build_asset_class_donut(class_df, currency):
     chart_df = class_df[class_df["Value"] > 0].copy()
 
@@ -256,16 +428,23 @@ def overview_app():
 
     user_id = st.session_state.user_id
 
+    overview_data, unavailable_sources = load_overview_data(user_id)
+    settings = overview_data["settings"]
+
+    def setting(key, default):
+        # Only the pooled result: never re-query on the render thread.
+        return settings.get(key, default)
+
     # ---------------------------------------------------------
     # MASTER REPORTING CURRENCY
     # ---------------------------------------------------------
-    master_index = int(load_setting(user_id, "overview_currency_index", 0))
+    master_index = int(setting("overview_currency_index", 0))
     if not 0 <= master_index < len(CURRENCY_OPTIONS):
         master_index = 0
 
     master_currency = CURRENCY_OPTIONS[master_index]
     default_master_rate = 14.5 if master_currency["code"] == "GHS" else 1.0
-    master_rate = load_setting(user_id, "overview_rate", default_master_rate)
+    master_rate = setting("overview_rate", default_master_rate)
 
     st.sidebar.header("🌐 Unified Overview")
 
@@ -306,29 +485,33 @@ def overview_app():
     # ---------------------------------------------------------
     # MODULE SETTINGS
     # ---------------------------------------------------------
-    crypto_rate = load_setting(user_id, "crypto_rate", 14.5)
-    crypto_invested = load_setting(user_id, "crypto_investment", 0.0)
+    crypto_rate = setting("crypto_rate", 14.5)
+    crypto_invested = setting("crypto_investment", 0.0)
 
-    stock_rate = load_setting(user_id, "stock_rate", 14.5)
-    stock_invested = load_setting(user_id, "stock_investment", 0.0)
-    stock_cash = load_setting(user_id, "stock_cash", 0.0)
+    stock_rate = setting("stock_rate", 14.5)
+    stock_invested = setting("stock_investment", 0.0)
+    stock_cash = setting("stock_cash", 0.0)
 
-    etf_rate = load_setting(user_id, "etf_rate", 14.5)
-    etf_invested = load_setting(user_id, "etf_investment", 0.0)
-    etf_cash = load_setting(user_id, "etf_cash", 0.0)
+    etf_rate = setting("etf_rate", 14.5)
+    etf_invested = setting("etf_investment", 0.0)
+    etf_cash = setting("etf_cash", 0.0)
 
-    bond_display_rate = load_setting(user_id, "bond_rate", 14.5)
-    bond_cash = load_setting(user_id, "bond_cash", 0.0)
+    bond_display_rate = setting("bond_rate", 14.5)
+    bond_cash = setting("bond_cash", 0.0)
 
     # ---------------------------------------------------------
     # HOLDINGS + LIVE PRICES
     # ---------------------------------------------------------
-    crypto_holdings = load_crypto_holdings(user_id)
-    stock_holdings = load_stock_holdings(user_id)
-    etf_holdings = load_etf_holdings(user_id)
-    bond_holdings = load_bond_holdings(user_id)
-
-    crypto_prices, stock_prices, etf_prices = get_market_prices()
+    crypto_holdings = overview_data["crypto"]
+    stock_holdings = overview_data["stock"]
+    etf_holdings = overview_data["etf"]
+    bond_holdings = overview_data["bond"]
+
+    crypto_prices, stock_prices, etf_prices = get_market_prices(
+        crypto_holdings,
+        stock_holdings,
+        etf_holdings,
+    )
 
     holding_rows = []
     failed_assets = []
@@ -544,6 +727,13 @@ def overview_app():
         fmt(total_cash, master_currency),
     )
 
+    if unavailable_sources:
+        st.warning(
+            "Some portfolio data could not be loaded in time: "
+            + ", ".join(unavailable_sources)
+            + ". Totals may be incomplete until the next refresh."
+        )
+
     if failed_assets:
         st.warning(
             "Some live prices are temporarily unavailable: "
@@ -742,7 +932,7 @@ def overview_app():
     st.markdown("---")
     st.subheader("Unified Portfolio Trend")
 
-    history = clean_history(load_overview_history(user_id))
+    history = overview_data["history"]
 
     if len(history) >= 2:
         fig = go.Figure()
@@ -815,7 +1005,7 @@ def overview_app():
 
     # Only autosave when every held market-priced asset was successfully
     # valued. This prevents temporary API failures from creating false drops.
-    if total_value > 0 and not failed_assets:
+    if total_value > 0 and not failed_assets and not unavailable_sources:
         autosave_portfolio_value(
             user_id,
             total_value,
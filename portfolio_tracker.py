@@ -1,26 +1,54 @@
 # portfolio_tracker.py
 
-from datetime import datetime
-from db import get_supabase
+import threading
+import time
+from datetime import datetime, timezone
+
 import streamlit as st
 
+from db import get_secret
+from snapshot_writer import snapshot_writer
+
 
 # -----------------------------------------
-# SESSION-BOUND CLIENT
+# AUTOSAVE SNAPSHOT POLICY
+# - at most one autosave per user/mode per
+#   SNAPSHOT_MIN_INTERVAL_SECONDS,
+# - only when the value moved by at least
+#   SNAPSHOT_MIN_CHANGE_PCT (or the heartbeat
+#   interval passed),
+# - one row per SNAPSHOT_BUCKET_SECONDS bucket,
+#   upserted on (user_id, mode, timestamp).
 # -----------------------------------------
-def db():
-    supabase = get_supabase()
+SNAPSHOT_MIN_INTERVAL_SECONDS = float(
+    get_secret("SNAPSHOT_MIN_INTERVAL_SECONDS", 300)
+)
+SNAPSHOT_MIN_CHANGE_PCT = float(get_secret("SNAPSHOT_MIN_CHANGE_PCT", 0.5))
+SNAPSHOT_HEARTBEAT_SECONDS = float(
+    get_secret("SNAPSHOT_HEARTBEAT_SECONDS", 3600)
+)
+SNAPSHOT_BUCKET_SECONDS = int(get_secret("SNAPSHOT_BUCKET_SECONDS", 900))
+
+# (user_id, mode) -> (saved_at, value); shared by all sessions.
+# Entries older than SNAPSHOT_HEARTBEAT_SECONDS no longer affect the
+# policy and are pruned.
+_last_autosave = {}
+_autosave_lock = threading.Lock()
+_autosave_pruned_at = 0.0
 
-    if "access_token" in st.session_state:
-        try:
-            supabase.auth.set_session(
-                access_token=st.session_state.access_token,
-                refresh_token=st.session_state.refresh_token,
-            )
-        except Exception:
-            pass
 
-    return supabase
+# -----------------------------------------
+# QUEUED HISTORY WRITES
+# Rows are handed to the process-wide writer
+# and flushed in bulk off the render thread.
+# -----------------------------------------
+def queue_snapshot(row, upsert=False, urgent=False):
+    return snapshot_writer.enqueue(
+        row,
+        access_token=st.session_state.get("access_token"),
+        upsert=upsert,
+        urgent=urgent,
+    )
 
 
 # -----------------------------------------
@@ -32,16 +60,15 @@ def manual_snapshot(user_id: str, value_ghs: float, mode: str):
         return False
 
     try:
-        db().table("portfolio_history").insert(
+        return queue_snapshot(
             {
                 "user_id": user_id,
                 "timestamp": datetime.utcnow().isoformat(),
                 "value_ghs": round(float(value_ghs), 2),
                 "mode": mode,
-            }
-        ).execute()
-
-        return True
+            },
+            urgent=True,
+        )
 
     except Exception as e:
         print("Manual snapshot failed:", e)
@@ -49,22 +76,95 @@ def manual_snapshot(user_id: str, value_ghs: float, mode: str):
 
 
 # -----------------------------------------
-# ⚡ LIGHT AUTOSAVE (NON-BLOCKING)
+# SNAPSHOT POLICY HELPERS
+# -----------------------------------------
+def bucket_timestamp(now=None, bucket_seconds=None):
+    now = time.time() if now is None else now
+    bucket_seconds = bucket_seconds or SNAPSHOT_BUCKET_SECONDS
+    start = int(now // bucket_seconds) * bucket_seconds
+
+    return (
+        datetime.fromtimestamp(start, tz=timezone.utc)
+        .replace(tzinfo=None)
+        .isoformat()
+    )
+
+
+def should_autosave(previous, value, now):
+    """
+    `previous` is the (saved_at, value) of the last autosave, or None.
+    """
+    if previous is None:
+        return True
+
+    saved_at, saved_value = previous
+    elapsed = now - saved_at
+
+    if elapsed < SNAPSHOT_MIN_INTERVAL_SECONDS:
+        return False
+
+    if elapsed >= SNAPSHOT_HEARTBEAT_SECONDS or saved_value <= 0:
+        return True
+
+    change_pct = abs(value - saved_value) / saved_value * 100
+
+    return change_pct >= SNAPSHOT_MIN_CHANGE_PCT
+
+
+# -----------------------------------------
+# ⚡ LIGHT AUTOSAVE (THROTTLED)
 # -----------------------------------------
 def autosave_portfolio_value(user_id: str, value_ghs: float, mode: str):
 
     if not user_id or value_ghs <= 0:
         return
 
+    value = round(float(value_ghs), 2)
+    key = (user_id, mode)
+    now = time.time()
+
+    with _autosave_lock:
+        _prune_autosaves(now)
+        previous = _last_autosave.get(key)
+
+        if not should_autosave(previous, value, now):
+            return
+
+        # Claim the slot so concurrent sessions of the user don't both
+        # save; released again below if the row can't be queued.
+        _last_autosave[key] = (now, value)
+
+    row = {
+        "user_id": user_id,
+        "timestamp": bucket_timestamp(now),
+        "value_ghs": value,
+        "mode": mode,
+    }
+
     try:
-        db().table("portfolio_history").insert(
-            {
-                "user_id": user_id,
-                "timestamp": datetime.utcnow().isoformat(),
-                "value_ghs": round(float(value_ghs), 2),
-                "mode": mode,
-            }
-        ).execute()
+        queued = queue_snapshot(row, upsert=True)
+    except Exception as e:
+        print("Autosave failed:", e)
+        queued = False
+
+    if not queued:
+        with _autosave_lock:
+            if _last_autosave.get(key) == (now, value):
+                if previous is None:
+                    _last_autosave.pop(key, None)
+                else:
+                    _last_autosave[key] = previous
+
+
+def _prune_autosaves(now):
+    # Called with _autosave_lock held; sweeps at most once per interval.
+    global _autosave_pruned_at
+
+    if now - _autosave_pruned_at < SNAPSHOT_MIN_INTERVAL_SECONDS:
+        return
+
+    _autosave_pruned_at = now
+    cutoff = now - SNAPSHOT_HEARTBEAT_SECONDS
 
-    except Exception:
-        pass
+    for key in [k for k, (saved_at, _) in _last_autosave.items() if saved_at < cutoff]:
+        del _last_autosave[key]
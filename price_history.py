@@ -1,14 +1,52 @@
-import requests
+import csv
+import io
+import os
+from pathlib import Path
+
 import yfinance as yf
 import streamlit as st
 
+from market_data import LastKnownGoodStore, MarketDataService
+from price_providers import FunctionProvider, ProviderChain, ReplayProvider
+from upstream import upstream
+
 
 # ---------------------------------------------
-# CACHE SETTINGS
+# REFRESH SETTINGS (SECONDS)
 # ---------------------------------------------
 CRYPTO_CACHE_TTL = 300
 STOCK_CACHE_TTL = 300
 
+# Newly requested symbols are held briefly so requests from
+# concurrent sessions merge into one upstream batch.
+STOCK_COALESCE_SECONDS = 0.5
+
+# Per-source limits for one concurrent refresh cycle.
+SOURCE_TIMEOUTS = {
+    "crypto": 15,
+    "stocks": 25,
+}
+
+# A chain gives up this much earlier than its source timeout, so its
+# partial results are returned before the outer wait_for cancels it.
+CHAIN_TIMEOUT_MARGIN = 1.0
+
+# How long a primary provider may take before the next
+# provider in the chain is raced against it.
+PROVIDER_LATENCY_BUDGET = {
+    "crypto": 3.0,
+    "stocks": 5.0,
+}
+
+# A cold process (no published or last-known-good prices yet) lets the
+# first render wait this long for the first fetch instead of showing
+# no prices.
+COLD_START_WAIT_SECONDS = 5.0
+
+# Last-known-good prices survive restarts so cold
+# sessions never start from an empty price list.
+PRICE_CACHE_FILE = Path(__file__).parent / "data" / "last_known_prices.json"
+
 
 # ---------------------------------------------
 # CRYPTO MAP
@@ -68,83 +106,312 @@ CRYPTO_IDS = {
 
 
 # ---------------------------------------------
-# CRYPTO LIVE PRICES
+# CRYPTO FETCHER (UPSTREAM)
 # ---------------------------------------------
-@st.cache_data(ttl=CRYPTO_CACHE_TTL, show_spinner=False)
-def crypto_live_prices():
+def fetch_crypto_prices(symbols):
 
     prices = {}
+    ids = {sym: CRYPTO_IDS[sym] for sym in symbols if sym in CRYPTO_IDS}
+
+    if not ids:
+        return prices
 
     try:
         url = (
             "https://api.coingecko.com/api/v3/simple/price"
-            "?ids=" + ",".join(CRYPTO_IDS.values()) +
+            "?ids=" + ",".join(ids.values()) +
             "&vs_currencies=usd"
         )
 
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
+        r = upstream.get("coingecko", url, timeout=10)
         data = r.json()
 
-        for sym, cg_id in CRYPTO_IDS.items():
+        for sym, cg_id in ids.items():
             prices[sym] = float(data.get(cg_id, {}).get("usd", 0.0))
 
     except Exception:
         prices = {}
 
-    if prices:
-        st.session_state.crypto_last_prices = prices
-        return prices
-
-    return st.session_state.get("crypto_last_prices", {})
+    return prices
 
 
 # ---------------------------------------------
-# STOCK LIVE PRICES
+# CRYPTO FALLBACK (COINBASE EXCHANGE RATES)
+# One request returns units per USD for every
+# listed asset; the USD price is the inverse.
 # ---------------------------------------------
-@st.cache_data(ttl=STOCK_CACHE_TTL, show_spinner=False)
-def stock_live_prices(symbols):
+def fetch_coinbase_prices(symbols):
 
     prices = {}
 
     try:
-        tickers = " ".join(symbols)
+        r = upstream.get(
+            "coinbase",
+            "https://api.coinbase.com/v2/exchange-rates",
+            params={"currency": "USD"},
+            timeout=10,
+        )
+        rates = r.json().get("data", {}).get("rates", {})
+
+        for sym in symbols:
+            rate = float(rates.get(sym) or 0.0)
+
+            if rate > 0:
+                prices[sym] = 1.0 / rate
+
+    except Exception:
+        prices = {}
+
+    return prices
+
+
+# ---------------------------------------------
+# STOCK FETCHER (UPSTREAM, LATEST QUOTE ONLY)
+# Daily bars over a few sessions are enough to
+# carry the latest price; the last valid close
+# of every ticker is taken in one vectorized step.
+# ---------------------------------------------
+STOCK_QUOTE_PERIOD = "5d"
+
+# Tickers per yfinance request; larger watch lists are split
+# into several chunks of one merged, deduplicated batch.
+STOCK_BATCH_SIZE = 100
+
+
+def fetch_stock_prices(symbols):
+
+    symbols = list(dict.fromkeys(symbols))
+    prices = {}
 
-        data = yf.download(
-            tickers=tickers,
-            period="1d",
-            interval="1m",
+    for start in range(0, len(symbols), STOCK_BATCH_SIZE):
+        prices.update(
+            fetch_stock_chunk(symbols[start:start + STOCK_BATCH_SIZE])
+        )
+
+    return prices
+
+
+def fetch_stock_chunk(symbols):
+
+    if not symbols:
+        return {}
+
+    def download():
+        # threads=False: yfinance makes one Yahoo request per ticker, so
+        # a threaded chunk would burst up to STOCK_BATCH_SIZE requests
+        # past the one limiter token the chunk takes.
+        return yf.download(
+            tickers=" ".join(symbols),
+            period=STOCK_QUOTE_PERIOD,
+            interval="1d",
             progress=False,
             threads=False,
             auto_adjust=False,
         )
 
-        if data.empty:
-            return st.session_state.get("stock_last_prices", {})
+    try:
+        data = upstream.call("yahoo", download)
+    except Exception:
+        return {}
 
-        for sym in symbols:
-            try:
-                if "Close" in data:
-                    close_data = data["Close"]
+    # An empty frame (delisted tickers, market holidays) is a valid
+    # answer, not an upstream failure: nothing to retry or count.
+    if data is None or data.empty:
+        return {}
+
+    if "Close" not in data:
+        return {}
+
+    close_data = data["Close"]
+
+    if not hasattr(close_data, "columns"):
+        close_data = close_data.to_frame(name=symbols[0])
+
+    last_close = close_data.ffill().iloc[-1].dropna()
+
+    return {
+        str(sym): float(price)
+        for sym, price in last_close.items()
+        if price > 0
+    }
+
+
+# ---------------------------------------------
+# STOCK FALLBACK (STOOQ CSV QUOTES)
+# ---------------------------------------------
+def fetch_stooq_prices(symbols):
+
+    tickers = {f"{sym.lower()}.us": sym for sym in symbols}
+    prices = {}
 
-                    if hasattr(close_data, "columns"):
-                        price = close_data[sym].dropna().iloc[-1]
-                    else:
-                        price = close_data.dropna().iloc[-1]
+    if not tickers:
+        return prices
 
-                    prices[sym] = float(price)
+    try:
+        r = upstream.get(
+            "stooq",
+            "https://stooq.com/q/l/",
+            params={
+                "s": "+".join(tickers),
+                "f": "sd2t2c",
+                "h": "",
+                "e": "csv",
+            },
+            timeout=10,
+        )
 
-                else:
-                    prices[sym] = 0.0
+        for row in csv.DictReader(io.StringIO(r.text)):
+            sym = tickers.get(str(row.get("Symbol", "")).lower())
 
-            except Exception:
-                prices[sym] = 0.0
+            try:
+                price = float(row.get("Close") or 0.0)
+            except ValueError:
+                continue
+
+            if sym and price > 0:
+                prices[sym] = price
 
     except Exception:
         prices = {}
 
-    if prices:
-        st.session_state.stock_last_prices = prices
-        return prices
+    return prices
+
+
+# ---------------------------------------------
+# SAFE SECRET LOADER
+# ---------------------------------------------
+def get_secret(key, default=None):
+    env_value = os.getenv(key)
+    if env_value:
+        return env_value
+
+    try:
+        return st.secrets.get(key, default)
+    except Exception:
+        return default
+
+
+# ---------------------------------------------
+# PRICE PROVIDERS
+# PRICE_PROVIDER=replay serves recorded or
+# synthetic quotes from PRICE_REPLAY_FILE, so
+# dashboards run without the internet.
+# ---------------------------------------------
+def replay_mode():
+    return str(get_secret("PRICE_PROVIDER", "live")).lower() == "replay"
+
+
+def build_price_providers():
+    if replay_mode():
+        path = get_secret("PRICE_REPLAY_FILE", "data/price_replay.json")
+        latency = float(get_secret("PRICE_REPLAY_LATENCY_MS", 0)) / 1000
+
+        return {
+            "crypto": ReplayProvider(path, "crypto", latency=latency),
+            "stocks": ReplayProvider(path, "stocks", latency=latency),
+        }
+
+    # Ordered fallback chains: primary first.
+    return {
+        "crypto": ProviderChain(
+            "crypto",
+            [
+                FunctionProvider("coingecko", fetch_crypto_prices),
+                FunctionProvider("coinbase", fetch_coinbase_prices),
+            ],
+            latency_budget=PROVIDER_LATENCY_BUDGET["crypto"],
+            timeout=SOURCE_TIMEOUTS["crypto"] - CHAIN_TIMEOUT_MARGIN,
+        ),
+        "stocks": ProviderChain(
+            "stocks",
+            [
+                FunctionProvider("yahoo", fetch_stock_prices),
+                FunctionProvider("stooq", fetch_stooq_prices),
+            ],
+            latency_budget=PROVIDER_LATENCY_BUDGET["stocks"],
+            timeout=SOURCE_TIMEOUTS["stocks"] - CHAIN_TIMEOUT_MARGIN,
+        ),
+    }
+
+
+# ---------------------------------------------
+# SHARED MARKET DATA SERVICE
+# One refresher per server process; every
+# session reads the same published snapshot.
+# ---------------------------------------------
+@st.cache_resource(show_spinner=False)
+def get_market_data():
+    providers = build_price_providers()
+
+    # Replay runs must be reproducible, so they never read or write
+    # the last-known-good file.
+    store = None if replay_mode() else LastKnownGoodStore(PRICE_CACHE_FILE)
+
+    return MarketDataService(
+        fetch_crypto=providers["crypto"],
+        fetch_stocks=providers["stocks"],
+        crypto_interval=CRYPTO_CACHE_TTL,
+        stock_interval=STOCK_CACHE_TTL,
+        coalesce_window=STOCK_COALESCE_SECONDS,
+        store=store,
+        timeouts=SOURCE_TIMEOUTS,
+    ).start()
+
+
+# ---------------------------------------------
+# HOLDINGS-AWARE SYMBOL SELECTION
+# ---------------------------------------------
+def held_symbols(holdings):
+    """
+    Symbols with a non-zero quantity. Only these are requested
+    upstream, so catalogue size does not drive request cost.
+    """
+    held = []
+
+    for sym, qty in holdings.items():
+        try:
+            if float(qty or 0.0) > 0:
+                held.append(sym)
+        except (TypeError, ValueError):
+            continue
+
+    return held
+
+
+def _select(quotes, symbols):
+    return {sym: quotes[sym].price for sym in symbols if sym in quotes}
+
+
+def _quotes(service, asset_class, symbols):
+    quotes = getattr(service.snapshot(), asset_class)
+
+    if any(sym not in quotes for sym in symbols):
+        service.wait_for_first_fetch(asset_class, COLD_START_WAIT_SECONDS)
+        quotes = getattr(service.snapshot(), asset_class)
+
+    return quotes
+
+
+# ---------------------------------------------
+# CRYPTO LIVE PRICES
+# ---------------------------------------------
+def crypto_live_prices(symbols=None):
+    if symbols is None:
+        symbols = list(CRYPTO_IDS.keys())
+
+    service = get_market_data()
+    service.watch("crypto", symbols)
+
+    return _select(_quotes(service, "crypto", symbols), symbols)
+
+
+# ---------------------------------------------
+# STOCK LIVE PRICES
+# ---------------------------------------------
+def stock_live_prices(symbols):
+    symbols = list(dict.fromkeys(symbols))
+
+    service = get_market_data()
+    service.watch("stocks", symbols)
 
-    return st.session_state.get("stock_last_prices", {})
+    return _select(_quotes(service, "stocks", symbols), symbols)
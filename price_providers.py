@@ -0,0 +1,264 @@
+# price_providers.py
+import abc
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+# A price tagged with the provider that supplied it.
+SourcedPrice = namedtuple("SourcedPrice", ["price", "provider"])
+
+
+# -----------------------------------------
+# PROVIDER INTERFACE
+# A provider turns a list of symbols into a
+# {symbol: usd_price} dict. Missing symbols
+# are simply left out.
+# -----------------------------------------
+class PriceProvider(abc.ABC):
+    name = "provider"
+
+    @abc.abstractmethod
+    def fetch(self, symbols):
+        """
+        Return {symbol: usd_price} for the symbols this provider knows.
+        """
+
+    def __call__(self, symbols):
+        return self.fetch(symbols)
+
+
+class FunctionProvider(PriceProvider):
+    """
+    Adapts a plain fetch function (e.g. the CoinGecko or Yahoo
+    fetchers in price_history) to the provider interface.
+    """
+
+    def __init__(self, name, fetch_fn):
+        self.name = name
+        self._fetch_fn = fetch_fn
+
+    def fetch(self, symbols):
+        return self._fetch_fn(symbols)
+
+
+# -----------------------------------------
+# FALLBACK CHAIN
+# -----------------------------------------
+class ProviderChain(PriceProvider):
+    """
+    Ordered fallback chain for one asset class. The primary gets
+    `latency_budget` seconds; if it is slower, fails, or misses symbols,
+    the next provider is raced for whatever is still missing. Every
+    price comes back as a SourcedPrice naming the provider that won.
+    """
+
+    def __init__(self, name, providers, latency_budget=3.0, timeout=15.0):
+        self.name = name
+        self.providers = list(providers)
+        self.latency_budget = latency_budget
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(2, 2 * len(self.providers)),
+            thread_name_prefix=f"{name}-chain",
+        )
+
+    def _safe_fetch(self, provider, symbols):
+        try:
+            return provider.fetch(symbols) or {}
+        except Exception as error:
+            print(f"Price provider '{provider.name}' failed:", error)
+            return {}
+
+    def fetch(self, symbols):
+        symbols = list(dict.fromkeys(symbols))
+        results = {}
+        pending = {}
+        queue = list(self.providers)
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            missing = [sym for sym in symbols if sym not in results]
+            remaining = deadline - time.monotonic()
+
+            if not missing or remaining <= 0:
+                break
+
+            if queue:
+                provider = queue.pop(0)
+                future = self._executor.submit(self._safe_fetch, provider, missing)
+                pending[future] = provider
+                wait_for = min(self.latency_budget, remaining)
+
+            elif pending:
+                wait_for = remaining
+
+            else:
+                break
+
+            done, _ = wait(
+                list(pending),
+                timeout=wait_for,
+                return_when=FIRST_COMPLETED,
+            )
+
+            for future in done:
+                provider = pending.pop(future)
+
+                for sym, price in future.result().items():
+                    try:
+                        price = float(price or 0.0)
+                    except (TypeError, ValueError):
+                        continue
+
+                    if sym not in results and price > 0:
+                        results[sym] = SourcedPrice(price, provider.name)
+
+        return results
+
+
+# -----------------------------------------
+# REPLAY PROVIDER (OFFLINE)
+# File format:
+# {"crypto": [{"BTC": 64000.0, ...}, ...],
+#  "stocks": [{"AAPL": 190.1, ...}, ...]}
+# Each fetch serves the next frame, after an
+# optional artificial latency.
+# -----------------------------------------
+class ReplayProvider(PriceProvider):
+
+    def __init__(self, path, asset_class, latency=0.0, loop=True):
+        self.name = f"replay:{asset_class}"
+        self.latency = float(latency)
+        self.loop = loop
+
+        with open(path, "r") as f:
+            self._frames = json.load(f).get(asset_class) or []
+
+        self._step = 0
+        self._lock = threading.Lock()
+
+    def next_frame(self):
+        with self._lock:
+            if not self._frames:
+                return {}
+
+            if self._step >= len(self._frames):
+                if not self.loop:
+                    return self._frames[-1]
+                self._step = 0
+
+            frame = self._frames[self._step]
+            self._step += 1
+
+        return frame
+
+    def fetch(self, symbols):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        frame = self.next_frame()
+
+        return {
+            sym: float(frame[sym])
+            for sym in symbols
+            if sym in frame
+        }
+
+
+# -----------------------------------------
+# RECORDING PROVIDER
+# Wraps a live provider and appends every
+# response as a replay frame.
+# -----------------------------------------
+class RecordingProvider(PriceProvider):
+
+    def __init__(self, inner, path, asset_class):
+        self.name = f"recording:{inner.name}"
+        self._inner = inner
+        self._path = path
+        self._asset_class = asset_class
+        self._lock = threading.Lock()
+
+    def fetch(self, symbols):
+        prices = self._inner.fetch(symbols)
+
+        if prices:
+            with self._lock:
+                try:
+                    with open(self._path, "r") as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    data = {}
+
+                data.setdefault(self._asset_class, []).append(prices)
+
+                with open(self._path, "w") as f:
+                    json.dump(data, f)
+
+        return prices
+
+
+# -----------------------------------------
+# SYNTHETIC REPLAY FILES
+# Seeded geometric random walks, so two runs
+# with the same seed serve identical quotes.
+# -----------------------------------------
+def synthetic_frames(symbols, steps, seed=0, volatility=0.01, start_price=100.0):
+    rng = random.Random(seed)
+    prices = {
+        sym: start_price * (0.5 + rng.random() * 10)
+        for sym in symbols
+    }
+    frames = []
+
+    for _ in range(steps):
+        for sym in symbols:
+            prices[sym] *= math.exp(rng.gauss(0.0, volatility))
+
+        frames.append({sym: round(price, 6) for sym, price in prices.items()})
+
+    return frames
+
+
+def write_synthetic_replay(path, symbols_by_class, steps=500, seed=0):
+    data = {
+        asset_class: synthetic_frames(symbols, steps, seed=seed + index)
+        for index, (asset_class, symbols) in enumerate(
+            sorted(symbols_by_class.items())
+        )
+    }
+
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write a deterministic synthetic price replay file."
+    )
+    parser.add_argument("path")
+    parser.add_argument("--crypto", default="BTC,ETH,SOL,XRP,BNB")
+    parser.add_argument("--stocks", default="AAPL,MSFT,NVDA,SPY,QQQ")
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_synthetic_replay(
+        args.path,
+        {
+            "crypto": [s for s in args.crypto.split(",") if s],
+            "stocks": [s for s in args.stocks.split(",") if s],
+        },
+        steps=args.steps,
+        seed=args.seed,
+    )
+
+    print(f"Wrote {args.steps} frames to {args.path}")
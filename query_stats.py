@@ -0,0 +1,240 @@
+# query_stats.py
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+import streamlit as st
+
+
+# -----------------------------------------
+# DATABASE QUERY INSTRUMENTATION
+# Every table / rpc call made through a client
+# from db.py is timed and recorded (table, op,
+# rows, latency, error). The session's log is
+# reset at the start of each rerun, summarised
+# in the DEBUG sidebar panel and printed.
+# -----------------------------------------
+SLOW_QUERY_SECONDS = 1.0
+
+# The same table + operation this many times in one rerun is
+# flagged as a probable N+1 pattern.
+REPEATED_QUERY_COUNT = 5
+
+QUERY_LOG_LIMIT = 500
+
+OPERATIONS = ["select", "insert", "upsert", "update", "delete"]
+
+
+class QueryLog:
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self._calls = deque(maxlen=QUERY_LOG_LIMIT)
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._calls.clear()
+            self.started_at = time.perf_counter()
+
+    def record(self, table, op, rows, seconds, error=None):
+        with self._lock:
+            self._calls.append({
+                "table": table,
+                "op": op,
+                "rows": rows,
+                "ms": round(seconds * 1000, 1),
+                "error": error,
+                "thread": threading.current_thread().name,
+            })
+
+        if seconds >= SLOW_QUERY_SECONDS:
+            print(
+                f"SLOW QUERY [{self.name}]:",
+                f"{table}.{op}",
+                f"{seconds * 1000:.0f}ms",
+                f"rows={rows}",
+            )
+
+    def calls(self):
+        with self._lock:
+            return list(self._calls)
+
+    def summary(self):
+        """
+        One row per (table, op): call count, rows, total / max ms, errors.
+        """
+        calls = self.calls()
+
+        if not calls:
+            return pd.DataFrame(
+                columns=["table", "op", "calls", "rows", "total_ms", "max_ms", "errors"]
+            )
+
+        frame = pd.DataFrame(calls)
+        frame["failed"] = frame["error"].notna()
+
+        return (
+            frame.groupby(["table", "op"], as_index=False)
+            .agg(
+                calls=("ms", "size"),
+                rows=("rows", "sum"),
+                total_ms=("ms", "sum"),
+                max_ms=("ms", "max"),
+                errors=("failed", "sum"),
+            )
+            .sort_values("total_ms", ascending=False)
+            .reset_index(drop=True)
+        )
+
+    def log_summary(self):
+        calls = self.calls()
+        elapsed = time.perf_counter() - self.started_at
+        total_ms = sum(call["ms"] for call in calls)
+        errors = sum(1 for call in calls if call["error"])
+
+        print(
+            f"DB QUERIES [{self.name}]:",
+            f"queries={len(calls)}",
+            f"db_ms={total_ms:.0f}",
+            f"rerun_ms={elapsed * 1000:.0f}",
+            f"errors={errors}",
+        )
+
+        summary = self.summary()
+
+        for row in summary[summary["calls"] >= REPEATED_QUERY_COUNT].itertuples():
+            print(
+                f"REPEATED QUERY [{self.name}]:",
+                f"{row.table}.{row.op} x{row.calls}",
+            )
+
+
+# -----------------------------------------
+# CLIENT / QUERY WRAPPERS
+# -----------------------------------------
+def _row_count(data):
+    if isinstance(data, list):
+        return len(data)
+    return 1 if data else 0
+
+
+class InstrumentedQuery:
+    """
+    Wraps a query builder; builder methods return wrapped builders so
+    the final execute() is timed.
+    """
+
+    def __init__(self, builder, log, table, op="select"):
+        self._builder = builder
+        self._log = log
+        self._table = table
+        self._op = op
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+
+            if not hasattr(result, "execute"):
+                return result
+
+            op = name if name in OPERATIONS else self._op
+            return InstrumentedQuery(result, self._log, self._table, op)
+
+        return call
+
+    def execute(self):
+        started = time.perf_counter()
+
+        try:
+            res = self._builder.execute()
+
+        except Exception as error:
+            self._log.record(
+                self._table,
+                self._op,
+                0,
+                time.perf_counter() - started,
+                error=f"{type(error).__name__}: {error}",
+            )
+            raise
+
+        self._log.record(
+            self._table,
+            self._op,
+            _row_count(getattr(res, "data", None)),
+            time.perf_counter() - started,
+        )
+
+        return res
+
+
+class InstrumentedClient:
+    """
+    Supabase client proxy that records every table and rpc call in
+    `query_log`. Everything else (auth, storage, ...) passes through.
+    """
+
+    def __init__(self, client, log):
+        self._client = client
+        self.query_log = log
+
+    def table(self, name):
+        return InstrumentedQuery(self._client.table(name), self.query_log, name)
+
+    from_ = table
+
+    def rpc(self, fn, *args, **kwargs):
+        return InstrumentedQuery(
+            self._client.rpc(fn, *args, **kwargs),
+            self.query_log,
+            fn,
+            "rpc",
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# -----------------------------------------
+# DEBUG PANEL
+# -----------------------------------------
+def render_query_panel(log):
+    """
+    Sidebar summary of the queries made during this rerun.
+    """
+    calls = log.calls()
+    summary = log.summary()
+    elapsed = time.perf_counter() - log.started_at
+    errors = [call for call in calls if call["error"]]
+
+    with st.sidebar.expander("🛠 Database queries (debug)"):
+        first, second = st.columns(2)
+        first.metric("Queries", len(calls))
+        second.metric("DB time", f"{sum(c['ms'] for c in calls):.0f} ms")
+
+        st.caption(f"Rerun time so far: {elapsed * 1000:.0f} ms")
+
+        repeated = summary[summary["calls"] >= REPEATED_QUERY_COUNT]
+
+        for row in repeated.itertuples():
+            st.warning(f"{row.table}.{row.op} ran {row.calls} times (possible N+1).")
+
+        slow = [call for call in calls if call["ms"] >= SLOW_QUERY_SECONDS * 1000]
+
+        for call in slow:
+            st.warning(f"Slow: {call['table']}.{call['op']} took {call['ms']:.0f} ms.")
+
+        for call in errors:
+            st.error(f"{call['table']}.{call['op']}: {call['error']}")
+
+        if not summary.empty:
+            st.dataframe(summary, hide_index=True, use_container_width=True)
+            st.dataframe(pd.DataFrame(calls), hide_index=True, use_container_width=True)
@@ -0,0 +1,154 @@
+# settings_store.py
+import time
+
+import streamlit as st
+
+from auth import get_auth_client
+from local_mirror import get_mirror
+
+
+# -----------------------------------------
+# SESSION SETTINGS CACHE
+# All of a user's user_settings rows are read
+# in one query and kept for the session;
+# save_setting writes through to the cache.
+# -----------------------------------------
+SETTINGS_CACHE_KEY = "user_settings_cache"
+SETTINGS_CACHE_SECONDS = 300
+
+# A failed load is cached (as no values) this long, so a rerun makes at
+# most one attempt instead of one per load_setting call.
+SETTINGS_RETRY_SECONDS = 30
+
+
+class SettingsUnavailable(Exception):
+    pass
+
+
+def cached_settings(user_id, raise_errors=False):
+    """
+    Settings from the session cache or the local mirror, or None when
+    they have to be fetched. Never queries Supabase.
+    """
+    cache = st.session_state.get(SETTINGS_CACHE_KEY)
+
+    if cache and cache["user_id"] == user_id:
+        failed = cache.get("failed", False)
+        max_age = SETTINGS_RETRY_SECONDS if failed else SETTINGS_CACHE_SECONDS
+
+        if time.time() - cache["loaded_at"] < max_age:
+            if failed and raise_errors:
+                raise SettingsUnavailable("user_settings could not be loaded")
+
+            return cache["values"]
+
+    mirror = get_mirror()
+
+    if mirror is not None:
+        mirror.remember_token(user_id, st.session_state.get("access_token"))
+        values = mirror.read("user_settings", user_id)
+
+        if values is not None:
+            _cache_settings(user_id, values)
+            return values
+
+    return None
+
+
+def fetch_settings(client, user_id):
+    """
+    Query the user's settings with `client`. Raises on failure and
+    touches no session state, so it is safe to run off the script
+    thread; pass the result to store_settings.
+    """
+    res = (
+        client.table("user_settings")
+        .select("key,value")
+        .eq("user_id", user_id)
+        .execute()
+    )
+
+    values = {}
+
+    for row in res.data or []:
+        try:
+            values[row["key"]] = float(row["value"])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    return values
+
+
+def store_settings(user_id, values, failed=False):
+    """
+    Cache fetched settings for the session (and the mirror). A failed
+    load is cached as {} for SETTINGS_RETRY_SECONDS.
+    """
+    mirror = get_mirror()
+
+    if mirror is not None and not failed:
+        mirror.replace("user_settings", user_id, values)
+
+    _cache_settings(user_id, values, failed=failed)
+
+
+def load_settings(user_id, refresh=False, raise_errors=False):
+    """
+    Return {key: float_value} for every user_settings row of the user.
+
+    When the query fails the defaults ({}) are returned, or
+    SettingsUnavailable is raised if raise_errors is set.
+    """
+    if not refresh:
+        values = cached_settings(user_id, raise_errors=raise_errors)
+
+        if values is not None:
+            return values
+
+    try:
+        values = fetch_settings(get_auth_client(), user_id)
+
+    except Exception as error:
+        print("Load settings failed:", error)
+        store_settings(user_id, {}, failed=True)
+
+        if raise_errors:
+            raise SettingsUnavailable("user_settings could not be loaded") from error
+
+        return {}
+
+    store_settings(user_id, values)
+
+    return values
+
+
+def _cache_settings(user_id, values, failed=False):
+    st.session_state[SETTINGS_CACHE_KEY] = {
+        "user_id": user_id,
+        "loaded_at": time.time(),
+        "values": values,
+        "failed": failed,
+    }
+
+
+def load_setting(user_id, key, default):
+    return load_settings(user_id).get(key, default)
+
+
+def save_setting(user_id, key, value):
+    mirror = get_mirror()
+
+    if mirror is not None:
+        # Written locally now, pushed to Supabase by the mirror.
+        mirror.remember_token(user_id, st.session_state.get("access_token"))
+        mirror.write("user_settings", user_id, {key: float(value)})
+    else:
+        get_auth_client().table("user_settings").upsert(
+            {"user_id": user_id, "key": key, "value": float(value)},
+            on_conflict="user_id,key",
+        ).execute()
+
+    cache = st.session_state.get(SETTINGS_CACHE_KEY)
+
+    if cache and cache["user_id"] == user_id:
+        cache["values"][key] = float(value)
@@ -0,0 +1,298 @@
+# snapshot_writer.py
+import atexit
+import threading
+import time
+from collections import deque
+
+from db import create_token_client, get_service_client
+
+
+# -----------------------------------------
+# WRITE-BEHIND SETTINGS
+# -----------------------------------------
+SNAPSHOT_FLUSH_SECONDS = 3.0
+SNAPSHOT_QUEUE_LIMIT = 5000
+SNAPSHOT_BATCH_SIZE = 500
+SNAPSHOT_RETRY_MAX_SECONDS = 300.0
+SNAPSHOT_SHUTDOWN_TIMEOUT = 5.0
+
+HISTORY_CONFLICT_KEY = "user_id,mode,timestamp"
+MISSING_CONFLICT_INDEX = "42P10"
+
+# HTTP statuses / Postgres error classes (data, constraint, syntax or
+# permission) that mean the rows themselves were rejected.
+PERMANENT_STATUSES = {400, 403, 404, 409, 422}
+PERMANENT_CODE_CLASSES = ["22", "23", "42"]
+
+
+def is_retryable(error):
+    """
+    Network errors, timeouts, expired tokens (401), 429 and 5xx are
+    worth retrying; rejections of the rows are not.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+
+    try:
+        if status is not None and int(status) in PERMANENT_STATUSES:
+            return False
+    except (TypeError, ValueError):
+        pass
+
+    code = str(getattr(error, "code", "") or "")
+
+    return code[:2] not in PERMANENT_CODE_CLASSES
+
+
+# -----------------------------------------
+# PROCESS-WIDE WRITE-BEHIND QUEUE
+# -----------------------------------------
+class SnapshotWriter:
+    """
+    Collects portfolio_history rows from every session and writes them
+    from one background thread as bulk inserts/upserts.
+
+    Each entry is (row, access_token, upsert, attempts, retry_at). With
+    a service role key all rows go out in one request per kind;
+    otherwise rows are grouped per user token (the newest token seen for
+    the row's user, so a rotated token replaces an expired one) and RLS
+    still sees the owning user.
+
+    The queue is bounded: when it is full the oldest rows are dropped.
+    A failed group backs off on its own (exponentially, capped) while
+    other groups keep being written; rows are only dropped when the
+    server rejects them outright.
+    """
+
+    def __init__(
+        self,
+        table="portfolio_history",
+        flush_interval=SNAPSHOT_FLUSH_SECONDS,
+        max_queue=SNAPSHOT_QUEUE_LIMIT,
+        batch_size=SNAPSHOT_BATCH_SIZE,
+        retry_max_seconds=SNAPSHOT_RETRY_MAX_SECONDS,
+    ):
+        self.table = table
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retry_max_seconds = retry_max_seconds
+
+        self._queue = deque(maxlen=max_queue)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._clients = {}
+        self._tokens = {}
+        self._counters = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "retried": 0,
+            "dropped": 0,
+        }
+
+    # ---------- producer side ----------
+    def enqueue(self, row, access_token=None, upsert=False, urgent=False):
+        with self._lock:
+            self._append([(row, access_token, upsert, 0, 0.0)])
+            self._counters["queued"] += 1
+
+            if access_token and row.get("user_id"):
+                if len(self._tokens) > 1000:
+                    self._tokens.clear()
+
+                self._tokens[row["user_id"]] = access_token
+
+        self.start()
+
+        if urgent:
+            self._wake.set()
+
+        return True
+
+    def _append(self, entries, front=False):
+        """
+        Called with _lock held. A full queue drops its oldest rows (the
+        left end) and counts them. Requeued rows go in front, since they
+        are older than anything enqueued while they were being written.
+        """
+        if not front:
+            for entry in entries:
+                if len(self._queue) == self._queue.maxlen:
+                    self._counters["dropped"] += 1
+
+                self._queue.append(entry)
+            return
+
+        combined = list(entries) + list(self._queue)
+        overflow = max(0, len(combined) - self._queue.maxlen)
+
+        self._counters["dropped"] += overflow
+        self._queue.clear()
+        self._queue.extend(combined[overflow:])
+
+    def pending(self):
+        with self._lock:
+            return len(self._queue)
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "pending": len(self._queue)}
+
+    # ---------- worker ----------
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+
+            self._thread = threading.Thread(
+                target=self._run,
+                name="snapshot-writer",
+                daemon=True,
+            )
+            self._thread.start()
+
+        return self
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _drain(self):
+        with self._lock:
+            entries = list(self._queue)
+            self._queue.clear()
+
+        return entries
+
+    def _client(self, access_token):
+        service = get_service_client()
+
+        if service is not None:
+            return service
+
+        if access_token not in self._clients:
+            # Tokens rotate hourly; keep the cache from growing forever.
+            if len(self._clients) > 200:
+                self._clients.clear()
+
+            self._clients[access_token] = create_token_client(access_token)
+
+        return self._clients[access_token]
+
+    def _write(self, client, rows, upsert):
+        table = client.table(self.table)
+
+        if not upsert:
+            table.insert(rows).execute()
+            return
+
+        # One statement cannot upsert the same key twice; keep the latest.
+        latest = {}
+
+        for row in rows:
+            latest[(row["user_id"], row["mode"], row["timestamp"])] = row
+
+        try:
+            table.upsert(
+                list(latest.values()),
+                on_conflict=HISTORY_CONFLICT_KEY,
+            ).execute()
+
+        except Exception as error:
+            # No unique bucket index yet (see migrations/001).
+            if getattr(error, "code", None) != MISSING_CONFLICT_INDEX:
+                raise
+
+            client.table(self.table).insert(list(latest.values())).execute()
+
+    def flush(self, force=False):
+        """
+        Write every queued row that is not backing off (all of them when
+        `force` is set). Returns the number of rows written.
+        """
+        written = 0
+
+        with self._flush_lock:
+            now = time.monotonic()
+            entries = self._drain()
+            due = [e for e in entries if force or e[4] <= now]
+            later = [e for e in entries if not (force or e[4] <= now)]
+
+            groups = {}
+            use_service = get_service_client() is not None
+
+            for entry in due:
+                row, token, upsert, _, _ = entry
+                token = self._tokens.get(row.get("user_id"), token)
+                key = (None if use_service else token, upsert)
+                groups.setdefault(key, []).append(entry)
+
+            for (token, upsert), group in groups.items():
+                for start in range(0, len(group), self.batch_size):
+                    chunk = group[start:start + self.batch_size]
+                    rows = [entry[0] for entry in chunk]
+
+                    try:
+                        self._write(self._client(token), rows, upsert)
+
+                    except Exception as error:
+                        print("Snapshot batch write failed:", error)
+                        # Only this group waits; the others still go out.
+                        later.extend(self._backoff(group[start:], error))
+                        break
+
+                    written += len(rows)
+
+                    with self._lock:
+                        self._counters["written"] += len(rows)
+                        self._counters["batches"] += 1
+
+            with self._lock:
+                self._append(later, front=True)
+
+        return written
+
+    def _backoff(self, entries, error):
+        if not is_retryable(error):
+            with self._lock:
+                self._counters["dropped"] += len(entries)
+            return []
+
+        retry = []
+        now = time.monotonic()
+
+        for row, token, upsert, tries, _ in entries:
+            delay = min(self.retry_max_seconds, 2 ** (tries + 1))
+            retry.append((row, token, upsert, tries + 1, now + delay))
+
+        with self._lock:
+            self._counters["retried"] += len(retry)
+
+        return retry
+
+    def close(self, timeout=SNAPSHOT_SHUTDOWN_TIMEOUT):
+        """
+        Stop the worker and make a last attempt to write what is queued.
+        """
+        self._stopping = True
+        self._wake.set()
+
+        thread = self._thread
+
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+
+        deadline = time.monotonic() + timeout
+
+        while self.pending() and time.monotonic() < deadline:
+            if not self.flush(force=True):
+                break
+
+
+snapshot_writer = SnapshotWriter()
+
+atexit.register(snapshot_writer.close)
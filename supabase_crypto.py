@@ -1,5 +1,6 @@
 from supabase_client import supabase
 from datetime import datetime
+from holdings_store import write_holdings_diff
 
 # -----------------------------
 # CRYPTO HOLDINGS
@@ -9,14 +10,12 @@ def load_crypto_holdings(user_id):
     return {r["symbol"]: float(r["quantity"]) for r in res.data}
 
 def save_crypto_holdings(user_id, holdings):
-    supabase.table("crypto_holdings").delete().eq("user_id", user_id).execute()
-
-    rows = [
-        {"user_id": user_id, "symbol": sym, "quantity": qty}
-        for sym, qty in holdings.items()
-    ]
-    if rows:
-        supabase.table("crypto_holdings").insert(rows).execute()
+    # `holdings` is the full new state: symbols missing from it are
+    # removed, and only changed symbols are written.
+    stored = load_crypto_holdings(user_id)
+    target = {sym: 0.0 for sym in stored}
+    target.update(holdings)
+    write_holdings_diff(supabase, "crypto_holdings", user_id, stored, target)
 
 # -----------------------------
 # CRYPTO HISTORY
@@ -1,18 +1,18 @@
 from supabase_client import supabase
 from datetime import datetime
+from holdings_store import write_holdings_diff
 
 def load_stock_holdings(user_id):
     res = supabase.table("stock_holdings").select("*").eq("user_id", user_id).execute()
     return {r["symbol"]: float(r["quantity"]) for r in res.data}
 
 def save_stock_holdings(user_id, holdings):
-    supabase.table("stock_holdings").delete().eq("user_id", user_id).execute()
-    rows = [
-        {"user_id": user_id, "symbol": sym, "quantity": qty}
-        for sym, qty in holdings.items()
-    ]
-    if rows:
-        supabase.table("stock_holdings").insert(rows).execute()
+    # `holdings` is the full new state: symbols missing from it are
+    # removed, and only changed symbols are written.
+    stored = load_stock_holdings(user_id)
+    target = {sym: 0.0 for sym in stored}
+    target.update(holdings)
+    write_holdings_diff(supabase, "stock_holdings", user_id, stored, target)
 
 def save_stock_value(user_id, value_ghs):
     supabase.table("portfolio_history").insert({
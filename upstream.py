@@ -0,0 +1,287 @@
+# upstream.py
+import random
+import threading
+import time
+
+import requests
+
+
+# -----------------------------------------
+# ERRORS
+# -----------------------------------------
+class UpstreamError(RuntimeError):
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class RateLimitedError(UpstreamError):
+    pass
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+# -----------------------------------------
+# TOKEN BUCKET
+# -----------------------------------------
+class TokenBucket:
+    """
+    `rate` tokens per second, holding at most `capacity` for bursts.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.rate,
+        )
+        self._updated = now
+
+    def acquire(self, max_wait=0.0):
+        deadline = time.monotonic() + max_wait
+
+        while True:
+            with self._lock:
+                self._refill()
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+
+                wait = (1 - self._tokens) / self.rate
+
+            if time.monotonic() + wait > deadline:
+                return False
+
+            time.sleep(wait)
+
+
+# -----------------------------------------
+# CIRCUIT BREAKER
+# closed -> open after N consecutive failures,
+# open -> half-open after `reset_timeout`,
+# half-open -> closed on the first success.
+# -----------------------------------------
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            return self._state() != "open"
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+
+            if (
+                self._state() == "half-open"
+                or self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+
+
+# -----------------------------------------
+# SHARED UPSTREAM CLIENT
+# -----------------------------------------
+class UpstreamClient:
+    """
+    One limiter, breaker and counter set per provider, shared by every
+    session in the process. Calls back off exponentially with jitter on
+    retryable failures and fail fast while a provider's circuit is open.
+    """
+
+    def __init__(self):
+        self._providers = {}
+        self._lock = threading.Lock()
+        self._http = requests.Session()
+
+    def register(
+        self,
+        name,
+        rate,
+        burst,
+        max_wait=5.0,
+        max_retries=2,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        failure_threshold=5,
+        reset_timeout=60,
+    ):
+        with self._lock:
+            self._providers[name] = {
+                "bucket": TokenBucket(rate, burst),
+                "breaker": CircuitBreaker(failure_threshold, reset_timeout),
+                "max_wait": max_wait,
+                "max_retries": max_retries,
+                "backoff_base": backoff_base,
+                "backoff_max": backoff_max,
+                "counters": {
+                    "requests": 0,
+                    "successes": 0,
+                    "failures": 0,
+                    "retries": 0,
+                    "throttled": 0,
+                    "short_circuited": 0,
+                },
+            }
+
+    def _provider(self, name):
+        try:
+            return self._providers[name]
+        except KeyError:
+            raise UpstreamError(f"Unknown upstream provider: {name}")
+
+    def _count(self, provider, counter):
+        with self._lock:
+            provider["counters"][counter] += 1
+
+    def _backoff(self, provider, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(provider["backoff_max"], retry_after)
+
+        ceiling = min(
+            provider["backoff_max"],
+            provider["backoff_base"] * (2 ** attempt),
+        )
+        return random.uniform(0, ceiling)
+
+    def call(self, name, fn, *args, **kwargs):
+        """
+        Run `fn` under the provider's limiter and breaker. `fn` signals a
+        retryable failure by raising; its return value is passed through.
+        """
+        provider = self._provider(name)
+        breaker = provider["breaker"]
+        attempt = 0
+
+        while True:
+            if not breaker.allow():
+                self._count(provider, "short_circuited")
+                raise CircuitOpenError(f"{name} circuit is open")
+
+            if not provider["bucket"].acquire(provider["max_wait"]):
+                self._count(provider, "throttled")
+                raise RateLimitedError(f"{name} rate limit reached")
+
+            self._count(provider, "requests")
+
+            try:
+                result = fn(*args, **kwargs)
+
+            except Exception as error:
+                self._count(provider, "failures")
+                breaker.record_failure()
+
+                if not is_retryable(error) or attempt >= provider["max_retries"]:
+                    raise
+
+                self._count(provider, "retries")
+                time.sleep(self._backoff(provider, attempt, retry_after_seconds(error)))
+                attempt += 1
+                continue
+
+            self._count(provider, "successes")
+            breaker.record_success()
+            return result
+
+    def get(self, name, url, **kwargs):
+        """
+        GET through the shared pooled session. Non-2xx responses raise
+        `requests.HTTPError`; 429 and 5xx are retried.
+        """
+        def request():
+            response = self._http.get(url, **kwargs)
+            response.raise_for_status()
+            return response
+
+        return self.call(name, request)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    **provider["counters"],
+                    "breaker": provider["breaker"].state,
+                }
+                for name, provider in self._providers.items()
+            }
+
+
+def is_retryable(error):
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRYABLE_STATUS
+
+    return isinstance(error, (requests.RequestException, UpstreamError))
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+
+    if response is None:
+        return None
+
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+# -----------------------------------------
+# PROCESS-WIDE CLIENT + PROVIDER LIMITS
+# CoinGecko free tier: ~30 calls/min.
+# Marketaux free tier: 100 requests/day.
+# -----------------------------------------
+upstream = UpstreamClient()
+
+upstream.register("coingecko", rate=0.25, burst=5)
+upstream.register("coinbase", rate=1.0, burst=5)
+upstream.register("yahoo", rate=1.0, burst=5)
+upstream.register("stooq", rate=0.5, burst=3)
+upstream.register(
+    "marketaux",
+    rate=100 / 86400,
+    burst=3,
+    max_wait=0.0,
+    max_retries=1,
+    reset_timeout=300,
+)
+
+
+def upstream_stats():
+    return upstream.stats()